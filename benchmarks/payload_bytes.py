@@ -0,0 +1,105 @@
+"""
+Measures the bytes of a chave table edit between browser and server.
+
+An edit is one request (see save_chave_table) that sends the edited chave
+table and gets back only the tiebreaker of its round, the round and category
+tables are summed in the browser. For comparison the size of the round and
+category tables is printed, which the server sent back after every edit
+when it still updated them.
+
+Run from the repository folder: python benchmarks/payload_bytes.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+from openpyxl import Workbook
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repository, "capoeira_jogos"))
+sys.path.insert(0, os.path.join(repository, "tests"))
+
+from dash._utils import to_json  # noqa: E402
+
+from app_backup import get_autosaver  # noqa: E402
+from app_cache import NoUploadCache  # noqa: E402
+from app_state import (  # noqa: E402
+    get_category_table,
+    get_round_table,
+    get_state_store,
+)
+from dash_client import DashClient  # noqa: E402
+from jogos_app import Jogos_App  # noqa: E402
+
+field_sizes = [16, 64, 256]
+edits = 40
+category = "Benchmark"
+
+
+def write_roster(path, n_players):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = category
+    worksheet.append(["Benchmark roster"])
+    worksheet.append(["Apelido", "Name", "Vorname"])
+    for player in range(n_players):
+        worksheet.append([f"Apelido {player}", f"Name {player}", f"Vorname {player}"])
+    workbook.save(path)
+
+
+def measure(n_players, rng):
+    path = os.path.join(os.getcwd(), f"roster_{n_players}.xlsx")
+    write_roster(path, n_players)
+    client = DashClient(Jogos_App(upload_cache=NoUploadCache()).app)
+    client.upload(path)
+    # render every game type, so all chave tables exist
+    game_types = ["Sao Bento", "Benguela", "Iuna", "Angola"]
+    for tabs_id in client.find("shave-tabs"):
+        for game_type in game_types:
+            client.fire(tabs_id, "active_item", game_type)
+    table_ids = client.find("chave-table")
+
+    requests = client.requests
+    client.bytes_sent = client.bytes_received = 0
+    for _ in range(edits):
+        table_id = rng.choice(table_ids)
+        data = [dict(row) for row in client.get(table_id, "data")]
+        row = rng.choice(data)
+        column = rng.choice([column for column in row if column.startswith("Ref")])
+        row[column] = str(rng.randint(0, 10))
+        client.fire(table_id, "data", data)
+
+    session_id = client.get("session-id", "data")
+    full_tables = len(to_json(get_round_table(session_id, category, 1))) + len(
+        to_json(get_category_table(session_id, category))
+    )
+    # the snapshot is written now, not later outside of the temporary folder
+    get_autosaver().flush()
+    get_state_store().clear(session_id)
+    return (
+        (client.requests - requests) / edits,
+        client.bytes_sent // edits,
+        client.bytes_received // edits,
+        full_tables,
+    )
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{edits} random edits per field, bytes per edit")
+    print("players  requests  sent  received  round+category tables")
+    with tempfile.TemporaryDirectory() as directory:
+        # snapshots and journals are written to the working directory
+        os.chdir(directory)
+        for n_players in field_sizes:
+            requests, sent, received, full_tables = measure(n_players, rng)
+            print(
+                f"{n_players:7}  {requests:8.1f}  {sent:4}  {received:8}  {full_tables:21}"
+            )
+        os.chdir(repository)
+
+
+if __name__ == "__main__":
+    main()
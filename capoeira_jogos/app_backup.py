@@ -0,0 +1,94 @@
+import atexit
+import os
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a temporary path next to path and move it onto path afterwards.
+
+    The file is only replaced once it was written completely, so a crash
+    during writing never leaves a broken file behind.
+    """
+    directory, basename = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(
+        directory,
+        f".{basename}.{uuid.uuid4().hex}.tmp{os.path.splitext(basename)[1]}",
+    )
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class BackgroundWriter:
+    """
+    Calls write(session_id) for every dirty session in a background thread.
+
+    Edits only mark their session as dirty. The thread waits flush_interval
+    seconds after the first change, so a burst of edits results in a single
+    write and the callbacks never wait for the disk.
+    """
+
+    def __init__(self, write, flush_interval=2.0):
+        self.write = write
+        self.flush_interval = flush_interval
+        self._dirty = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def mark_dirty(self, session_id):
+        with self._condition:
+            self._dirty.add(session_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self):
+        """
+        Write all dirty sessions right away.
+        """
+        with self._condition:
+            dirty, self._dirty = self._dirty, set()
+        for session_id in dirty:
+            self._write(session_id)
+
+    def _write(self, session_id):
+        try:
+            self.write(session_id)
+        except PermissionError:
+            # e.g. the file is opened in excel, try again with the next flush
+            with self._condition:
+                self._dirty.add(session_id)
+        except Exception:
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._dirty:
+                    self._condition.wait()
+            # collect everything that changes in the meantime into one write
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_autosaver = None
+
+
+def get_autosaver():
+    return _autosaver
+
+
+def set_autosaver(autosaver):
+    global _autosaver
+    _autosaver = autosaver
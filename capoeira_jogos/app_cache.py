@@ -0,0 +1,121 @@
+"""
+On disk cache of uploaded roster files.
+
+The same file is often uploaded several times during an event (a browser
+reload, a second laptop, a restart after a crash). For every upload that
+starts a new tournament the parsed rows, the first round of every category
+and the rendered category tabs are stored as json, keyed by the sha256 of
+the file, its name and the scoring rules. The least recently used entries
+are removed once the cache grows larger than max_bytes.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from app_backup import atomic_path
+
+# change when the cached rows or layouts change, old entries are then ignored
+cache_version = 5
+
+
+def _to_json(value):
+    # dash components and numpy values of the layouts
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value.to_plotly_json()
+
+
+class UploadCache:
+    def __init__(self, directory="jogos_cache", max_bytes=64 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, content, filename, scoring_config):
+        file_hash = hashlib.sha256(content)
+        file_hash.update(
+            json.dumps(
+                [cache_version, filename, scoring_config], sort_keys=True
+            ).encode("utf8")
+        )
+        return file_hash.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """
+        Return the cached entry of key or None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf8") as cache_file:
+                entry = json.load(cache_file)
+            # the modification time marks when an entry was used last
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store entry, components are stored as their json.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        text = json.dumps(entry, default=_to_json, separators=(",", ":"))
+        with atomic_path(self._path(key)) as tmp_path:
+            with open(tmp_path, "w", encoding="utf8") as cache_file:
+                cache_file.write(text)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class NoUploadCache:
+    """
+    Used to switch the cache off.
+    """
+
+    def key(self, content, filename, scoring_config):
+        return None
+
+    def get(self, key):
+        return None
+
+    def put(self, key, entry):
+        pass
+
+
+_upload_cache = UploadCache()
+
+
+def get_upload_cache():
+    return _upload_cache
+
+
+def set_upload_cache(upload_cache):
+    global _upload_cache
+    _upload_cache = upload_cache
@@ -0,0 +1,139 @@
+"""
+Assignment of the players of a round to chaves.
+
+The players are snake seeded into the chaves, so every chave gets a strong
+and a weak player. A local search then swaps players of the same seeding
+pot between chaves until as few players as possible share a chave with
+someone of their own group (e.g. academy) or with someone they already
+shared a chave with in an earlier round.
+"""
+
+# penalty for two players in one chave
+same_group_penalty = 2
+rematch_penalty = 1
+# players of a pot that are tried as swap partners for a player
+swap_candidates = 48
+
+
+def snake_pots(n_players, sizes):
+    """
+    Return the chave and the seeding pot of every seeding position: the best
+    len(sizes) players (first pot) go to the chaves in order, the next ones
+    in reverse order and so on. Smaller chaves have to be at the end of
+    sizes.
+    """
+    positions = []
+    pot = 0
+    while len(positions) < n_players:
+        chaves = [chave for chave, size in enumerate(sizes) if size > pot]
+        if pot % 2:
+            chaves.reverse()
+        positions.extend((chave, pot) for chave in chaves)
+        pot += 1
+    return positions
+
+
+def _conflicts(groups, met):
+    def conflict(player_1, player_2):
+        shared_groups = sum(
+            group_1 == group_2
+            for group_1, group_2 in zip(groups[player_1], groups[player_2])
+            if group_1 is not None
+        )
+        return same_group_penalty * shared_groups + rematch_penalty * (
+            player_2 in met[player_1]
+        )
+
+    return conflict
+
+
+def assign_chaves(players, sizes, rng, groups=None, history=(), seeded=False):
+    """
+    Split players into chaves of the given sizes.
+
+    groups maps player -> list of group values (None for no group), history
+    holds the chaves of earlier rounds. With seeded the players are sorted
+    best first and are snake seeded, otherwise they are shuffled with rng
+    and may be swapped freely. Returns the players of every chave.
+    """
+    names = list(players)
+    if not seeded:
+        rng.shuffle(names)
+    n_players = len(names)
+    player_ids = {name: i for i, name in enumerate(names)}
+
+    # compare players by integer id, every group value becomes an int
+    group_values = {}
+    player_groups = [
+        [
+            (
+                None
+                if value in (None, "", 0)
+                else group_values.setdefault((column, value), len(group_values))
+            )
+            for column, value in enumerate((groups or {}).get(name, []))
+        ]
+        for name in names
+    ]
+    met = [set() for _ in names]
+    for chave in history:
+        chave_ids = [player_ids[name] for name in chave if name in player_ids]
+        for player in chave_ids:
+            met[player].update(other for other in chave_ids if other != player)
+    conflict = _conflicts(player_groups, met)
+
+    positions = snake_pots(n_players, sizes)
+    chave_of = [chave for chave, _ in positions]
+    members = [[] for _ in sizes]
+    for player, chave in enumerate(chave_of):
+        members[chave].append(player)
+    # swaps stay inside a seeding pot, so the chaves stay equally strong
+    pot_of = [pot if seeded else 0 for _, pot in positions]
+    pots = {}
+    for player, pot in enumerate(pot_of):
+        pots.setdefault(pot, []).append(player)
+
+    def cost(player, chave, without=None):
+        return sum(
+            conflict(player, other)
+            for other in members[chave]
+            if other != player and other != without
+        )
+
+    improved = True
+    while improved:
+        improved = False
+        conflicted = [
+            player for player in range(n_players) if cost(player, chave_of[player])
+        ]
+        rng.shuffle(conflicted)
+        for player in conflicted:
+            chave = chave_of[player]
+            player_cost = cost(player, chave)
+            if not player_cost:
+                continue
+            candidates = [
+                other for other in pots[pot_of[player]] if chave_of[other] != chave
+            ]
+            if len(candidates) > swap_candidates:
+                candidates = rng.sample(candidates, swap_candidates)
+
+            best_delta, best_other = 0, None
+            for other in candidates:
+                other_chave = chave_of[other]
+                delta = (
+                    cost(player, other_chave, without=other)
+                    + cost(other, chave, without=player)
+                    - player_cost
+                    - cost(other, other_chave)
+                )
+                if delta < best_delta:
+                    best_delta, best_other = delta, other
+            if best_other is not None:
+                other_chave = chave_of[best_other]
+                members[chave][members[chave].index(player)] = best_other
+                members[other_chave][members[other_chave].index(best_other)] = player
+                chave_of[player], chave_of[best_other] = other_chave, chave
+                improved = True
+
+    return [[names[player] for player in chave] for chave in members]
@@ -0,0 +1,113 @@
+"""
+Append only journal of everything needed to rebuild a tournament.
+
+Every line is a json list, either
+    ["round", category, round, players, chaves, pairs]
+when a round is created, or
+    ["score", category, round, chave, game_type, row, column, value]
+for every edited cell of a chave table.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+
+def journal_path(filename):
+    return "Journal_" + os.path.splitext(filename)[0] + ".jsonl"
+
+
+class ScoreJournal:
+    """
+    Appends entries to a journal file.
+
+    Every entry is written to the os right away, the (slow) fsync is batched
+    so the disk is synced at most once every fsync_interval seconds.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "a", encoding="utf8")
+        # end a line that was only written partially before a crash, so new
+        # entries do not get glued to it
+        if self._file.tell() > 0:
+            with open(path, "rb") as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b"\n":
+                    self._file.write("\n")
+                    self._file.flush()
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.sync)
+
+    def append(self, entry):
+        self.extend([entry])
+
+    def extend(self, entries):
+        if not entries:
+            return
+        lines = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for entry in entries
+        )
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            if self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        with self._lock:
+            self._timer = None
+            if not self._file.closed:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._file.close()
+
+
+def read_journal(path):
+    """
+    Return all entries of a journal. Lines that were only written partially
+    (e.g. during a power loss) are skipped.
+    """
+    entries = []
+    with open(path, encoding="utf8") as journal_file:
+        for line in journal_file:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def archive_journal(path):
+    """
+    Move an existing journal out of the way so a new tournament can start.
+    """
+    close_journal(path)
+    if os.path.exists(path):
+        root, extension = os.path.splitext(path)
+        os.replace(path, f"{root}_{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+
+
+_journals = {}
+
+
+def get_journal(path):
+    if path not in _journals:
+        _journals[path] = ScoreJournal(path)
+    return _journals[path]
+
+
+def close_journal(path):
+    journal = _journals.pop(path, None)
+    if journal is not None:
+        journal.close()
@@ -2,9 +2,15 @@ from dash import dcc, html, Dash, dash_table, Input, Output, State, MATCH, ALL
 from dash.dash_table.Format import Format, Scheme, Sign, Symbol
 import dash_bootstrap_components as dbc
 import pandas as pd
-from collections import defaultdict
+from functools import lru_cache
+import hashlib
+import json
 import random
 
+from app_scoring import round_shape
+from app_chaves import assign_chaves
+from app_schedule import max_rodas
+
 fontsize = 18
 
 
@@ -19,6 +25,7 @@ def create_basic_layout():
         },
         children=[
             html.Div(id="div-hidden", style={"display": "none"}),
+            dcc.Store(id="session-id"),
             dbc.Row([dbc.Col(html.H1("Capoeira Jogos"))]),  # end first row
             dbc.Row(
                 [
@@ -60,8 +67,10 @@ def create_basic_layout():
             dbc.Row(
                 [
                     html.P(
-                        "To start please click on 'Select Files' and select your prepared excel file."
-                        + "It is best if each player has a set 'Apelido' in the excel file.",
+                        "To start please click on 'Select Files' and select your prepared excel file "
+                        + "(or several files, e.g. one per academy, their categories are merged). "
+                        + "It is best if each player has a set 'Apelido' in the excel file. "
+                        + "To continue a saved tournament select its 'Tournament_<file>.sqlite' file instead.",
                         style={"font-size": fontsize},
                     ),
                     dcc.Upload(
@@ -83,17 +92,41 @@ def create_basic_layout():
                             "margin": "10px",
                             "font-size": fontsize,
                         },  # Allow multiple files to be uploaded
-                        multiple=False,
+                        multiple=True,
+                    ),
+                    dbc.Checkbox(
+                        id="resume-journal",
+                        label="Resume the tournament from the journal of this file "
+                        + "(e.g. after a crash or power loss)",
+                        value=False,
+                        style={"margin": "10px"},
+                    ),
+                    dbc.Button(
+                        "Export results to excel",
+                        id="export-results-button",
+                        style={"margin": "10px", "width": "25%"},
                     ),
+                    dcc.Download(id="download-results"),
                 ]
             ),
+            dbc.Alert(
+                "The server does not know this tournament any more (e.g. after a "
+                + "restart or when the file was uploaded in another browser), "
+                + "entered points are not saved. Please upload the excel file again "
+                + "with the resume checkbox ticked or upload the "
+                + "'Tournament_<file>.sqlite' file.",
+                id="session-expired",
+                color="danger",
+                is_open=False,
+                style={"font-size": fontsize},
+            ),
             dbc.Row(id="output-data-upload"),  # this is where everything else goes
         ],
     )
     return layout
 
 
-def create_category_tab(category, df):
+def create_category_tab(category, category_table, round_tabs, round_totals=None):
     """
     Noteable ids:
     t
@@ -101,18 +134,18 @@ def create_category_tab(category, df):
 
     {"type": "category-table", "index": category}: id for the category data table
 
+    {"type": "category-round-totals", "index": category}: points of every player
+    in every round ({round: {player: total}}) when the tab was created
+
     {"type": "chaves-row", "index": category}: here goes the chaves
 
     """
 
-    # add points columns to table
-    df["Points"] = 0
-    df.insert(0, "Points", df.pop("Points"))
-
     # create the point data table for the category
+    columns = category_table[0].keys() if category_table else ["Points"]
     data_table = dash_table.DataTable(
-        df.to_dict("records"),
-        [{"name": i, "id": i} for i in df.columns],
+        category_table,
+        [{"name": i, "id": i} for i in columns],
         id={"type": "category-table", "index": category},
     )
 
@@ -126,54 +159,111 @@ def create_category_tab(category, df):
                     f"Point and Chaves for {category}", style={"font-size": fontsize}
                 ),
             ),
+            dcc.Store(
+                id={"type": "category-round-totals", "index": category},
+                data=round_totals or {},
+            ),
             dbc.Row(
                 data_table,
             ),
             dbc.Row(
                 id={"type": "chaves-row", "index": category},
-                children=add_round_0(
-                    table_participants=data_table.data, category=category
-                ),
+                children=create_round_tabs(category=category, round_tabs=round_tabs),
             ),
         ],
     )
     return tab
 
 
-def add_round_0(table_participants, category):
-    names_list = [player["Apelido"] for player in table_participants]
-    player_per_shaves = 4
-    # create chaves
-    shaves_dict, pairs_dict = create_round(names_list, player_per_shaves)
-    # create the first tab
-    shave_tabs = create_round_tabs(
-        category=category,
-        round_number=1,
-        players=names_list,
-        shave_pairs=pairs_dict,
-        shave_names_dict=shaves_dict,
+def chave_sizes(n_players, player_per_shaves):
+    """
+    Split the players into chaves of 3 to player_per_shaves players. Instead
+    of filling up the last chave with placeholders the players are spread
+    evenly, e.g. 10 players in chaves of 4 gives chaves of 4, 3 and 3.
+    Only when that is not possible chaves get more players (e.g. 5 players
+    in chaves of 4 give one chave of 5), no chave has fewer than 3 players
+    unless there are fewer players in total.
+    """
+    no_chaves = max(1, -(-n_players // player_per_shaves))
+    while no_chaves > 1 and n_players // no_chaves < 3:
+        no_chaves -= 1
+    size, bigger_chaves = divmod(n_players, no_chaves)
+    return [size + 1] * bigger_chaves + [size] * (no_chaves - bigger_chaves)
+
+
+def round_rng(filename, category, round):
+    """
+    Return the random generator for the chaves of one round of a category.
+    Its seed only depends on the file, the category and the round, so the
+    same file always gives the same chaves, independent of the other
+    categories and of anything else that uses random.
+    """
+    seed = hashlib.sha256(json.dumps([filename, category, round]).encode("utf8"))
+    return random.Random(int.from_bytes(seed.digest()[:8], "big"))
+
+
+def split_round_in_chaves(
+    name_list, player_per_shaves, rng, groups=None, history=(), seeded=False
+):
+    """
+    Split the players into chaves, see assign_chaves for groups, history and
+    seeded. The list of the caller stays as it is.
+    """
+    chaves = assign_chaves(
+        name_list,
+        chave_sizes(len(name_list), player_per_shaves),
+        rng,
+        groups=groups,
+        history=history,
+        seeded=seeded,
     )
-    return shave_tabs
-
-
-def split_round_in_chaves(name_list, player_per_shaves):
-    random.seed(0.2)  # set fixed seed
-    random.shuffle(name_list)
-    # amount of chaves
-    if len(name_list) % player_per_shaves == 0:
-        no_chaves = len(name_list) // player_per_shaves
-    else:
-        no_chaves = (len(name_list) // player_per_shaves) + 1
-    print(no_chaves)
-    # fill up with empty players
-    name_list += ["Placeholder"] * (no_chaves * player_per_shaves - len(name_list))
-    # split names in chaves
-    shaves_dict = {}
-    for i in range(no_chaves):
-        shaves_dict[f"Chave {i}"] = name_list[
-            i * player_per_shaves : (i + 1) * player_per_shaves
+    return {f"Chave {i}": chave for i, chave in enumerate(chaves)}
+
+
+@lru_cache(maxsize=None)
+def round_robin_rounds(size):
+    """
+    Return the rounds of a round robin of size players (circle method) as
+    tuples of index pairs. Every player meets every other player once, with
+    an odd size one player rests in every round.
+    """
+    players = list(range(size)) + ([None] if size % 2 else [])
+    rounds = []
+    for _ in range(len(players) - 1):
+        games = [
+            tuple(sorted((players[i], players[-1 - i])))
+            for i in range(len(players) // 2)
+            if None not in (players[i], players[-1 - i])
         ]
-    return shaves_dict
+        rounds.append(tuple(sorted(games)))
+        # the first player stays, all others move one position
+        players = [players[0], players[-1]] + players[1:-1]
+    return tuple(sorted(rounds))
+
+
+@lru_cache(maxsize=None)
+def pairing_table(size, no_game_types):
+    """
+    Return the games of a chave with size players for every game type as
+    index pairs. Every game type is one round of the round robin (starting
+    over when there are more game types than rounds), so every player plays
+    at most once per game type. The games of a game type are ordered so the
+    players of the last games get the most rest.
+    """
+    rounds = round_robin_rounds(size)
+    last_game = [-1] * size
+    no_games = 0
+    table = []
+    for game_type in range(no_game_types):
+        games = rounds[game_type % len(rounds)] if rounds else ()
+        games = sorted(
+            games, key=lambda game: max(last_game[game[0]], last_game[game[1]])
+        )
+        for player_1, player_2 in games:
+            last_game[player_1] = last_game[player_2] = no_games
+            no_games += 1
+        table.append(tuple(games))
+    return tuple(table)
 
 
 def make_shaves_pairings(shave_names, game_types):
@@ -181,36 +271,24 @@ def make_shaves_pairings(shave_names, game_types):
     Generate pairrings for one shave and every game type.
     Return a dict
     """
-    # [A, C, A, B, A, B, A, C]
-    # [B, D, C, D, D, C, B, D]
-    # create a list of all possible combinations
-    combos = [
-        [shave_names[0], shave_names[1]],
-        [shave_names[2], shave_names[3]],
-        [shave_names[0], shave_names[2]],
-        [shave_names[1], shave_names[3]],
-        [shave_names[0], shave_names[3]],
-        [shave_names[1], shave_names[2]],
-        [shave_names[0], shave_names[1]],
-        [shave_names[2], shave_names[3]],
-    ]
-    games_per_type = 2  # two games for each game type, so every player plays once
-
-    # create a dict with game types as keys and empty lists as values
-    finished_pairs = defaultdict(list)
-
-    for game_type in game_types:
-        for i in range(games_per_type):
-            finished_pairs[game_type].append(combos.pop(0))
-
+    finished_pairs = {}
+    for game_type, games in zip(
+        game_types, pairing_table(len(shave_names), len(game_types))
+    ):
+        finished_pairs[game_type] = [
+            [shave_names[player_1], shave_names[player_2]]
+            for player_1, player_2 in games
+        ]
     return finished_pairs
 
 
-def create_round(name_list, player_per_shaves):
+def create_round(
+    name_list, player_per_shaves, game_types, rng, groups=None, history=(), seeded=False
+):
     # calc total games in round
-    game_types = ["Sao Bento", "Benguela", "Iuna", "Angola"]
-
-    shaves_dict = split_round_in_chaves(name_list, player_per_shaves)
+    shaves_dict = split_round_in_chaves(
+        name_list, player_per_shaves, rng, groups, history, seeded
+    )
     pair_dict = {}
     for key, shave_names in shaves_dict.items():
         pair_dict[key] = make_shaves_pairings(shave_names, game_types)
@@ -218,13 +296,7 @@ def create_round(name_list, player_per_shaves):
     return shaves_dict, pair_dict
 
 
-def create_round_tabs(
-    category,
-    round_number,
-    players,
-    shave_pairs,
-    shave_names_dict,
-):
+def create_round_tabs(category, round_tabs):
     tabs_layout = html.Div(
         [
             dbc.Row(
@@ -239,7 +311,7 @@ def create_round_tabs(
                             html.Br(),
                             "Ref1-P2 are the points that referee 1 gave to player 2.",
                             html.Br(),
-                            "This follows for Ref2 and Ref3 respectively.",
+                            "This follows for the other referees respectively.",
                         ]
                     ),
                     dbc.Button(
@@ -255,17 +327,15 @@ def create_round_tabs(
                     ),
                     dcc.Tabs(
                         id={"type": "cat-round-tabs", "index": category},
-                        children=[
-                            create_round_tab(
-                                category,
-                                round_number,
-                                players,
-                                shave_pairs,
-                                shave_names_dict,
-                            )
-                        ],
+                        children=round_tabs,
+                        value=round_tabs[-1].value,
                         style={"margin": "2%"},
                     ),
+                    # the values of the round tabs that are already rendered
+                    dcc.Store(
+                        id={"type": "rendered-rounds", "index": category},
+                        data=[round_tabs[-1].value],
+                    ),
                 ]
             ),
         ]
@@ -279,26 +349,52 @@ def create_round_tab(
     players,
     shave_pairs,
     shave_names_dict,
+    scoring_rules,
+    tables=None,
+    round_table=None,
+    finished=False,
+    contributions=None,
 ):
-    df_round = pd.DataFrame(players, columns=["Player"])
-    df_round["personal points"] = 0
-    df_round["game points"] = 0
-    df_round["total points"] = 0
-    df_round.drop(df_round[df_round["Player"] == "Placeholder"].index, inplace=True)
-    df_round.sort_values("Player", inplace=True)
+    """
+    Create the tab of one round, scored with the ScoringRules of its category.
+
+    tables (chave -> game type -> rows) and round_table hold already entered
+    points, e.g. when a tournament is resumed. They default to empty tables.
+    contributions are the raw points of every chave table
+    ({chave: {game_type: {player: [personal, game, games]}}}), the round table is
+    summed from them in the browser.
+    finished marks a round whose next round was already started.
+    """
+    if round_table is None:
+        df_round = pd.DataFrame(players, columns=["Player"])
+        df_round["personal points"] = 0
+        df_round["game points"] = 0
+        df_round["total points"] = 0
+        df_round["games"] = 0
+        df_round["points per game"] = 0
+        df_round.drop(df_round[df_round["Player"] == "Placeholder"].index, inplace=True)
+        df_round.sort_values("Player", inplace=True)
+        round_table = df_round.to_dict("records")
     overview_table = dash_table.DataTable(
-        df_round.to_dict("records"),
+        round_table,
         id={"type": "round_table", "round": round_number, "index": category},
     )
 
-    game_types = ["Sao Bento", "Benguela", "Iuna", "Angola"]
-
-    # create the tabs
+    # create the tabs, only the opened game type gets its chave tables, the
+    # others are rendered when they are opened the first time
+    game_types = round_shape(shave_pairs)[1]
     all_type_acc_item = []
     for game_type in game_types:
         all_type_acc_item.append(
             create_game_type_acc_item(
-                category, round_number, shave_names_dict, game_type, shave_pairs
+                category,
+                round_number,
+                shave_names_dict,
+                game_type,
+                shave_pairs,
+                scoring_rules.table_columns,
+                tables,
+                render=game_type == game_types[0],
             )
         )
 
@@ -306,13 +402,66 @@ def create_round_tab(
     shave_game_type_accordion = dbc.Accordion(
         id={"type": "shave-tabs", "category": category, "round": round_number},
         children=all_type_acc_item,
+        active_item=game_types[0],
         style={"margin": "2%"},
     )
 
     tab = dcc.Tab(
         children=[
+            dcc.Store(
+                id={
+                    "type": "round-contributions",
+                    "round": round_number,
+                    "index": category,
+                },
+                data={
+                    "game_point_factor": scoring_rules.game_point_factor,
+                    "columns": scoring_rules.column_weights(),
+                    "tables": contributions or {},
+                },
+            ),
+            dcc.Store(
+                id={
+                    "type": "rendered-game-types",
+                    "category": category,
+                    "round": round_number,
+                },
+                data=[game_types[0]],
+            ),
             html.Div(overview_table, style={"width": "50%", "margin": "2%"}),
             html.Div(shave_game_type_accordion, style={"width": "80%", "margin": "2%"}),
+            # the schedule of the rodas is planned once the number of rodas
+            # is entered
+            html.Div(
+                [
+                    dbc.InputGroup(
+                        [
+                            dbc.InputGroupText("How many rodas are there?"),
+                            dbc.Input(
+                                type="number",
+                                min=1,
+                                max=max_rodas(shave_pairs),
+                                step=1,
+                                id={
+                                    "type": "roda-count",
+                                    "round": round_number,
+                                    "index": category,
+                                },
+                            ),
+                        ],
+                        style={"width": "50%"},
+                        className="mb-3",
+                    ),
+                    html.Div(
+                        id={
+                            "type": "roda-schedule",
+                            "round": round_number,
+                            "index": category,
+                        }
+                    ),
+                ],
+                style={"width": "80%", "margin": "2%"},
+            ),
             dbc.Row(
                 style={"width": "80%", "margin": "3%"},
                 children=[
@@ -326,6 +475,7 @@ def create_round_tab(
                                     dcc.Dropdown(
                                         options=[32, 16, 8, 4],
                                         value=16,
+                                        clearable=False,
                                         id={
                                             "type": "advance-dropdown",
                                             "round": round_number,
@@ -346,14 +496,24 @@ def create_round_tab(
                                     dbc.InputGroupText(
                                         "In case of a draw please choose:"
                                     ),
-                                    dbc.RadioItems(
+                                    # as many tied players as there are open spots
+                                    dbc.Checklist(
                                         options=[],
+                                        value=[],
                                         id={
                                             "type": "round_tie_breaker",
                                             "round": round_number,
                                             "index": category,
                                         },
                                     ),
+                                    dcc.Store(
+                                        data=0,
+                                        id={
+                                            "type": "round-open-spots",
+                                            "round": round_number,
+                                            "index": category,
+                                        },
+                                    ),
                                 ],
                                 style={
                                     "margin-top": ".5%",
@@ -369,6 +529,7 @@ def create_round_tab(
                             dbc.Button(
                                 f"Finish Round {round_number}",
                                 disabled=True,
+                                n_clicks=1 if finished else None,
                                 id={
                                     "type": "add-round-button",
                                     "round": round_number,
@@ -377,7 +538,11 @@ def create_round_tab(
                                 style={"margin": ".5%", "width": "40%"},
                             ),
                             html.P(
-                                "Check the tiebreaker box before starting a new round",
+                                (
+                                    "new Round already started"
+                                    if finished
+                                    else "Check the tiebreaker box before starting a new round"
+                                ),
                                 id={
                                     "type": "check_tiebreaker_text",
                                     "round": round_number,
@@ -390,90 +555,96 @@ def create_round_tab(
             ),
         ],
         label=f"Round {round_number}",
+        value=f"round-{round_number}",
     )
     return tab
 
 
-def create_game_type_acc_item(category, round, shave_names_dict, game_type, pairs):
+def _minutes_text(minutes):
+    return f"{int(minutes // 60)}:{int(minutes % 60):02d}"
+
+
+def create_schedule_table(schedule, total_minutes):
+    """
+    Show the planned games of a round (see schedule_round), times are given
+    as h:mm from the start of the round.
+    """
+    schedule_df = pd.DataFrame(
+        {
+            "Start": [_minutes_text(game["start"]) for game in schedule],
+            "End": [_minutes_text(game["end"]) for game in schedule],
+            "Roda": [game["roda"] for game in schedule],
+            "Chave": [game["chave"] for game in schedule],
+            "Game type": [game["game_type"] for game in schedule],
+            "Player 1": [game["Player 1"] for game in schedule],
+            "Player 2": [game["Player 2"] for game in schedule],
+        }
+    )
+    return [
+        html.P(f"All games of the round take {_minutes_text(total_minutes)} h."),
+        dbc.Table.from_dataframe(schedule_df, striped=True, bordered=True, hover=True),
+    ]
+
+
+def create_empty_round_tab(round_number):
+    """
+    Placeholder for a round tab that is rendered when it is opened.
+    """
+    return dcc.Tab(
+        children=[],
+        label=f"Round {round_number}",
+        value=f"round-{round_number}",
+    )
+
+
+def make_chave_rows(chave_pairs_for_type, score_columns):
+    """
+    Create the empty table rows for the games of one chave and game type.
+    """
+    chave_rows = []
+    for player_1, player_2 in chave_pairs_for_type:
+        row = {"Player 1": player_1}
+        for column in score_columns:
+            row[column] = 0
+        row["Player 2"] = player_2
+        chave_rows.append(row)
+    return chave_rows
+
+
+def create_game_type_acc_item(
+    category,
+    round,
+    shave_names_dict,
+    game_type,
+    pairs,
+    table_columns,
+    tables=None,
+    render=True,
+):
+    """
+    Create the accordion item of one game type. Without render the item stays
+    empty until create_chave_cards fills it.
+    """
+    children = []
+    if render:
+        children = create_chave_cards(
+            category, round, shave_names_dict, game_type, pairs, table_columns, tables
+        )
+    return dbc.AccordionItem(title=game_type, item_id=game_type, children=children)
+
+
+def create_chave_cards(
+    category, round, shave_names_dict, game_type, pairs, table_columns, tables=None
+):
     # generate a small card for each chave that included the names and a table for the points
     def _create_chave_card(
-        category, round, shave_index, chave_names, game_type, chave_pairs_for_type
+        category, round, shave_index, chave_names, game_type, chave_rows
     ):
-        # create datatable for the chave
-
-        players_1 = [players[0] for players in chave_pairs_for_type]
-        players_2 = [players[1] for players in chave_pairs_for_type]
-        chave_df = pd.DataFrame(players_1, columns=["Player 1"])
-        chave_df["Ref1-P1"] = 0
-        chave_df["Ref1-P2"] = 0
-        chave_df["Ref1-GP"] = 0
-
-        chave_df["Ref2-P1"] = 0
-        chave_df["Ref2-P2"] = 0
-        chave_df["Ref2-GP"] = 0
-
-        chave_df["Ref3-P1"] = 0
-        chave_df["Ref3-P2"] = 0
-        chave_df["Ref3-GP"] = 0
-
-        chave_df["Player 2"] = players_2
-
-        # set table styling:
-
-        outer_table_style = [
-            {
-                "if": {"column_id": "Player 1"},
-                "width": "15%",
-                "textAlign": "left",
-                "backgroundColor": "rgb(50,50,50)",
-                "color": "white",
-                "border": "1px solid black",
-            },
-            {
-                "if": {"column_id": "Player 2"},
-                "width": "15%",
-                "backgroundColor": "rgb(23,35,230)",
-                "textAlign": "left",
-                "color": "white",
-            },
-        ]
-        inner_table_style_P1 = [
-            {
-                "if": {"column_id": c},
-                "max-width": "10%",
-                "backgroundColor": "rgb(90,90,90)",
-                "color": "white",
-            }
-            for c in ["Ref1-P1", "Ref2-P1", "Ref3-P1"]
-        ]
-        inner_table_style_P2 = [
-            {
-                "if": {"column_id": c},
-                "backgroundColor": "rgb(51,67,181)",
-                "max-width": "10%",
-                "color": "white",
-            }
-            for c in ["Ref1-P2", "Ref2-P2", "Ref3-P2"]
-        ]
-        inner_table_style_GP = [
-            {
-                "if": {"column_id": c},
-                "max-width": "10%",
-                "backgroundColor": "rgb(240,64,41)",
-                "color": "white",
-            }
-            for c in ["Ref1-GP", "Ref2-GP", "Ref3-GP"]
-        ]
-
-        style_data_conditional = (
-            outer_table_style
-            + inner_table_style_P1
-            + inner_table_style_P2
-            + inner_table_style_GP
-        )
+        # create datatable for the chave, the colors are shared by all chave
+        # tables (assets/chave_tables.css) so only rows and columns are sent
         chave_table = dash_table.DataTable(
-            chave_df.to_dict("records"),
-            columns=[{"name": i, "id": i} for i in chave_df.columns],
+            chave_rows,
+            columns=table_columns,
             id={
                 "type": "chave-table",
                 "round": round,
@@ -481,12 +652,7 @@ def create_game_type_acc_item(category, round, shave_names_dict, game_type, pair
                 "chave": shave_index,
                 "game_type": game_type,
             },
-            style_data_conditional=style_data_conditional,
         )
-        for column in chave_table.columns:
-            if "-" in column["name"]:
-                # column["type"] = "numeric"
-                column["editable"] = True
 
         card = dbc.Card(
             [
@@ -496,12 +662,20 @@ def create_game_type_acc_item(category, round, shave_names_dict, game_type, pair
                         chave_table,
                     ]
                 )
-            ]
+            ],
+            className="chave-card",
         )
         return card
 
     cards = []
     for shave in shave_names_dict.keys():
+        if tables is None:
+            chave_rows = make_chave_rows(
+                pairs[shave][game_type],
+                [column["id"] for column in table_columns if column.get("editable")],
+            )
+        else:
+            chave_rows = tables[shave][game_type]
         cards.append(
             _create_chave_card(
                 category,
@@ -509,9 +683,8 @@ def create_game_type_acc_item(category, round, shave_names_dict, game_type, pair
                 shave,
                 shave_names_dict[shave],
                 game_type,
-                pairs[shave][game_type],
+                chave_rows,
             )
         )
 
-    acc_item = dbc.AccordionItem(title=game_type, children=[html.Div(cards)])
-    return acc_item
+    return [html.Div(cards)]
@@ -1,12 +1,77 @@
-from dash import dcc, html, Dash, dash_table, Input, Output, State, MATCH, ALL
+from dash import (
+    dcc,
+    html,
+    Dash,
+    dash_table,
+    Input,
+    Output,
+    State,
+    MATCH,
+    ALL,
+    ctx,
+    set_props,
+    Patch,
+    no_update,
+)
+from dash.exceptions import PreventUpdate
 from dash.dash_table.Format import Format, Scheme, Sign, Symbol
 import dash_bootstrap_components as dbc
 import pandas as pd
 import numpy as np
 from tempfile import mkdtemp
 import base64
-import io
-from app_layout import create_category_tab, create_round_tab, create_round
+import shutil
+import sqlite3
+import os
+import json
+import hashlib
+from app_layout import (
+    create_category_tab,
+    create_round_tab,
+    create_empty_round_tab,
+    create_chave_cards,
+    create_schedule_table,
+    create_round,
+    round_rng,
+)
+from app_state import (
+    get_state_store,
+    new_session_id,
+    find_duplicate_players,
+    register_category,
+    register_round,
+    store_chave_table,
+    get_round_table,
+    get_round_ranking,
+    get_round_contributions,
+    get_category_table,
+    get_category_round_totals,
+    get_chave_tables,
+    get_category_scores,
+    get_round,
+    get_rounds,
+    get_round_tables,
+    get_scoring_rules,
+    get_player_groups,
+    get_category_chaves,
+    register_filename,
+    take_over_file,
+    get_filename,
+)
+from app_scoring import (
+    new_round_scores,
+    set_cell,
+    round_shape,
+    game_type_games,
+    scoring_rules_for,
+    scoring_config,
+)
+from app_schedule import schedule_round
+from app_roster import read_rosters, merge_rosters
+from app_cache import get_upload_cache
+from app_snapshot import is_snapshot, read_snapshot
+from app_backup import get_autosaver
+from app_journal import journal_path, read_journal, archive_journal, get_journal
 import random
 import itertools
 from collections import defaultdict
@@ -14,208 +79,707 @@ from collections import defaultdict
 fontsize = 18
 
 
-def load_jogos_config_table(content_str, filename_str, upload_label):
+def _replay_journal(entries):
     """
-    Loads the jogos config table from the given filepath.
+    Rebuild all rounds and their points from the entries of a journal.
+
+    Returns {category: {round: {"players", "chaves", "pairs", "scores"}}}.
+    """
+    rounds = defaultdict(dict)
+    for entry in entries:
+        if entry[0] == "round":
+            _, category, round, players, chaves, pairs = entry
+            rounds[category][round] = {
+                "players": players,
+                "chaves": chaves,
+                "pairs": pairs,
+                "scores": new_round_scores(pairs, scoring_rules_for(category)),
+            }
+        elif entry[0] == "score":
+            _, category, round, chave, game_type, row, column, value = entry
+            try:
+                round_data = rounds[category][round]
+                set_cell(
+                    round_data["scores"],
+                    round_data["pairs"],
+                    chave,
+                    game_type,
+                    row,
+                    column,
+                    value,
+                    scoring_rules_for(category),
+                )
+            except (KeyError, IndexError, ValueError):
+                # the entry belongs to a round that was never started
+                continue
+    return rounds
+
+
+def _create_round_tab_from_state(session_id, category, round, finished=False):
+    round_info = get_round(session_id, category, round)
+    return create_round_tab(
+        category=category,
+        round_number=round,
+        players=round_info["players"],
+        shave_pairs=round_info["pairs"],
+        shave_names_dict=round_info["chaves"],
+        scoring_rules=get_scoring_rules(session_id, category),
+        tables=get_round_tables(session_id, category, round),
+        round_table=get_round_table(session_id, category, round),
+        finished=finished,
+        contributions=get_round_contributions(session_id, category, round),
+    )
+
+
+def _session_expired(session_id):
+    """
+    Return True and show the expired message if the server does not know the
+    session (any more), e.g. after a restart. The browser keeps its session id
+    and nothing it sends could be stored.
+    """
+    if session_id is not None and get_filename(session_id) is not None:
+        return False
+    set_props("session-expired", {"is_open": True})
+    return True
+
+
+def _save_later(session_id):
+    # the snapshot is written later in the background
+    if get_autosaver() is not None:
+        get_autosaver().mark_dirty(session_id)
+
+
+def _session_journal(session_id):
+    return get_journal(journal_path(get_filename(session_id)))
+
+
+def _register_category_rounds(
+    session_id, filename, category, rows, category_rounds, journal, first_round=None
+):
+    """
+    Register a category with its rounds. Without replayed rounds
+    (category_rounds) the first round is created, or first_round (e.g. from
+    the upload cache) is used.
+    """
+    # add points columns to table
+    rows = [
+        {"Points": 0, **{column: row[column] for column in row if column != "Points"}}
+        for row in rows
+    ]
+    scoring_rules = scoring_rules_for(category)
+    register_category(session_id, category, rows, scoring_rules)
+
+    if not category_rounds:
+        if first_round is None:
+            names_list = [row["Apelido"] for row in rows]
+            shaves_dict, pairs_dict = create_round(
+                names_list,
+                scoring_rules.chave_size,
+                scoring_rules.game_types,
+                round_rng(filename, category, 1),
+                groups=get_player_groups(session_id, category),
+            )
+            first_round = {
+                "players": names_list,
+                "chaves": shaves_dict,
+                "pairs": pairs_dict,
+            }
+        category_rounds = {1: first_round}
+        journal.append(
+            [
+                "round",
+                category,
+                1,
+                first_round["players"],
+                first_round["chaves"],
+                first_round["pairs"],
+            ]
+        )
+
+    for round, round_data in category_rounds.items():
+        register_round(session_id, category, round, **round_data)
+
+
+def _create_category_tab_from_state(session_id, category):
+    # only the last round is rendered, the others when they are opened
+    rounds = get_rounds(session_id, category)
+    round_tabs = [create_empty_round_tab(round) for round in rounds]
+    round_tabs[-1] = _create_round_tab_from_state(session_id, category, rounds[-1])
+    return create_category_tab(
+        category,
+        get_category_table(session_id, category),
+        round_tabs,
+        get_category_round_totals(session_id, category),
+    )
+
+
+def _create_category_tabs(session_id, categories):
+    return [
+        _create_category_tab_from_state(session_id, category) for category in categories
+    ]
+
+
+def _journal_tournament(session_id, categories, journal):
+    # write all rounds and entered points of a session to a new journal
+    for category in categories:
+        for round in get_rounds(session_id, category):
+            round_info = get_round(session_id, category, round)
+            journal.append(
+                [
+                    "round",
+                    category,
+                    round,
+                    round_info["players"],
+                    round_info["chaves"],
+                    round_info["pairs"],
+                ]
+            )
+            journal.extend(
+                [
+                    [
+                        "score",
+                        category,
+                        round,
+                        chave,
+                        game_type,
+                        row_index,
+                        column,
+                        value,
+                    ]
+                    for chave, game_type_tables in get_round_tables(
+                        session_id, category, round
+                    ).items()
+                    for game_type, table_rows in game_type_tables.items()
+                    for row_index, row in enumerate(table_rows)
+                    for column, value in row.items()
+                    if column not in ("Player 1", "Player 2") and value
+                ]
+            )
+
+
+def _load_snapshot(content, filename, upload_label, old_session_id):
+    """
+    Rebuild a tournament from an uploaded snapshot (see app_snapshot). The
+    journal of the tournament starts again from the snapshot.
+    """
+    session_id = new_session_id()
+    tmp_dir = mkdtemp()
+    try:
+        snapshot_file = os.path.join(tmp_dir, "snapshot.sqlite")
+        with open(snapshot_file, "wb") as file:
+            file.write(content)
+        categories = read_snapshot(snapshot_file, session_id)
+    except (sqlite3.DatabaseError, ValueError, KeyError) as error:
+        get_state_store().clear(session_id)
+        return (
+            html.P(
+                f"{filename} is not a valid tournament file: {error}",
+                style={"font-size": fontsize},
+            ),
+            upload_label,
+            old_session_id,
+        )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if old_session_id is not None:
+        get_state_store().clear(old_session_id)
+    set_props("session-expired", {"is_open": False})
+    _take_over_file(session_id, upload_label)
+    journal_file = journal_path(get_filename(session_id))
+    archive_journal(journal_file)
+    _journal_tournament(session_id, categories, get_journal(journal_file))
+    _save_later(session_id)
+
+    category_tabs = _create_category_tabs(session_id, categories)
+    return (
+        dcc.Tabs(id="tabs-all-categories", children=category_tabs),
+        upload_label,
+        session_id,
+    )
+
+
+def _take_over_file(session_id, upload_label):
+    # only one session writes the journal and snapshot of a file, the
+    # other browser is told that its session expired
+    if take_over_file(session_id):
+        upload_label.children.append(
+            html.P(
+                "This file was open in another browser, only this browser "
+                "saves the tournament now.",
+                style={"font-size": fontsize},
+            )
+        )
+
+
+def _roster_errors(categories, schema_errors):
+    """
+    Return a Div listing the errors of the read roster or None.
+    """
+    # players are identified by their apelido, so it has to be unique
+    duplicate_messages = []
+    for sheet_name, rows in categories.items():
+        duplicates = find_duplicate_players([row["Apelido"] for row in rows])
+        if duplicates:
+            duplicate_messages.append(
+                html.P(
+                    f"{sheet_name}: " + ", ".join(duplicates),
+                    style={"font-size": fontsize},
+                )
+            )
+    if schema_errors or duplicate_messages:
+        messages = []
+        if schema_errors:
+            messages.append(
+                html.P(
+                    "The following sheets can not be read, please fix them "
+                    "and upload the file again:",
+                    style={"font-size": fontsize},
+                )
+            )
+            messages.extend(
+                html.P(f"{sheet_name}: {error}", style={"font-size": fontsize})
+                for sheet_name, errors in schema_errors.items()
+                for error in errors
+            )
+        if duplicate_messages:
+            messages.append(
+                html.P(
+                    "The following apelidos are used by more than one "
+                    "player, please make them unique and upload the "
+                    "file again:",
+                    style={"font-size": fontsize},
+                )
+            )
+            messages.extend(duplicate_messages)
+        return html.Div(messages)
+    return None
+
+
+def _tournament_filename(filenames):
+    # the files of one upload are one tournament, its journal and snapshot
+    # are named after all of them
+    if len(filenames) == 1:
+        return filenames[0]
+    return "+".join(os.path.splitext(filename)[0] for filename in filenames) + ".xlsx"
+
+
+def load_jogos_config_table(
+    content_list, filename_list, upload_label, old_session_id, resume
+):
+    """
+    Loads the jogos config tables of the uploaded files. The categories of
+    all files are merged into one tournament.
+
+    If resume is set and a journal of the same files exists, all rounds and
+    points of the journal are restored.
     """
 
-    if content_str is None:
-        return html.Div("Nothing Found"), upload_label
+    if not content_list:
+        return html.Div("Nothing Found"), upload_label, old_session_id
 
     else:
+        # convert file strings to data, sorted so the order of the selected
+        # files does not matter
+        files = sorted(
+            (
+                filename,
+                base64.decodebytes(content.encode("utf8").split(b";base64,")[1]),
+            )
+            for filename, content in zip(filename_list, content_list)
+        )
+        filenames = [filename for filename, _ in files]
+        contents = [content for _, content in files]
+        filename_str = _tournament_filename(filenames)
+
         # set new label
         upload_label = html.Div(
             [
                 html.P(
-                    "File uploaded: " + filename_str,
+                    "File uploaded: " + ", ".join(filenames),
                     style={"font-size": fontsize},
                 ),
             ]
         )
 
-        # convert file string to data
-        data = content_str.encode("utf8").split(b";base64,")[1]
-        decoded = base64.decodebytes(data)
-        df_dict = pd.read_excel(
-            io.BytesIO(decoded),
-            sheet_name=None,
-            skiprows=1,
+        if any(is_snapshot(content) for content in contents):
+            if len(contents) > 1:
+                return (
+                    html.P(
+                        "A tournament file has to be uploaded on its own.",
+                        style={"font-size": fontsize},
+                    ),
+                    upload_label,
+                    old_session_id,
+                )
+            return _load_snapshot(
+                contents[0], filename_str, upload_label, old_session_id
+            )
+
+        upload_cache = get_upload_cache()
+        cache_key = upload_cache.key(
+            b"".join(hashlib.sha256(content).digest() for content in contents),
+            filename_str,
+            scoring_config(),
         )
+        cached = upload_cache.get(cache_key)
+        if cached is not None:
+            # only files without errors are cached
+            categories, merged = cached["categories"], cached["merged"]
+        else:
+            rosters, schema_errors = [], {}
+            for filename, (roster, file_errors) in zip(
+                filenames, read_rosters(contents)
+            ):
+                rosters.append(roster)
+                for sheet_name, errors in file_errors.items():
+                    if len(filenames) > 1:
+                        sheet_name = f"{filename} {sheet_name}"
+                    schema_errors[sheet_name] = errors
+            categories, merged = merge_rosters(rosters)
+            errors = _roster_errors(categories, schema_errors)
+            if errors is not None:
+                return errors, upload_label, old_session_id
+
+        if merged:
+            upload_label.children.append(
+                html.P(
+                    "Players listed in more than one file were added once: "
+                    + "; ".join(
+                        f"{category}: " + ", ".join(apelidos)
+                        for category, apelidos in merged.items()
+                    ),
+                    style={"font-size": fontsize},
+                )
+            )
 
-        for key in df_dict.keys():
-            # remove whitespaces from column names
-            df_dict[key].rename(columns=lambda x: x.strip(), inplace=True)
-            # fill empty appelido with first or last name
-            df_dict[key].fillna(0, inplace=True)
-            df_dict[key].loc[df_dict[key]["Apelido"] == 0, "Apelido"] = df_dict[key][
-                "Vorname"
-            ]
-            df_dict[key].loc[df_dict[key]["Apelido"] == 0, "Apelido"] = df_dict[key][
-                "Name"
-            ]
+        # a new upload starts a new session, the old state is no longer needed
+        if old_session_id is not None:
+            get_state_store().clear(old_session_id)
+        session_id = new_session_id()
+        register_filename(session_id, filename_str)
+        set_props("session-expired", {"is_open": False})
+        _take_over_file(session_id, upload_label)
+
+        journal_file = journal_path(filename_str)
+        resumed = resume and os.path.exists(journal_file)
+        if resumed:
+            replayed_rounds = _replay_journal(read_journal(journal_file))
+        else:
+            archive_journal(journal_file)
+            replayed_rounds = {}
+        journal = get_journal(journal_file)
+        # a new tournament of a cached file starts with the cached first rounds
+        cached_layout = cached is not None and not resumed
+
+        # the state is written in the order of the file
+        for category, rows in categories.items():
+            _register_category_rounds(
+                session_id,
+                filename_str,
+                category,
+                rows,
+                replayed_rounds.get(category),
+                journal,
+                first_round=cached["rounds"][category] if cached_layout else None,
+            )
+        _save_later(session_id)
+        if cached_layout:
+            return (
+                dcc.Tabs(id="tabs-all-categories", children=cached["tabs"]),
+                upload_label,
+                session_id,
+            )
+
+        category_tabs = _create_category_tabs(session_id, categories)
+
+        if not resumed:
+            upload_cache.put(
+                cache_key,
+                {
+                    "categories": categories,
+                    "merged": merged,
+                    "rounds": {
+                        category: get_round(session_id, category, 1)
+                        for category in categories
+                    },
+                    "tabs": category_tabs,
+                },
+            )
+
+        jogos_tabs = dcc.Tabs(id="tabs-all-categories", children=category_tabs)
+
+        return jogos_tabs, upload_label, session_id
+
+
+def _cell_texts(table_data):
+    return [{column: str(value) for column, value in row.items()} for row in table_data]
 
-        jogos_tabs = dcc.Tabs(
-            id="tabs-all-categories",
-            children=[
-                create_category_tab(sheet_name, df_cat)
-                for sheet_name, df_cat in df_dict.items()
-            ],
-        )
 
-        return jogos_tabs, upload_label
-
-
-def collect_and_update_round_points(new_round_values, current_round_table):
-    # flatten 2d list
-
-    new_round_values = list(itertools.chain.from_iterable(new_round_values))
-    # convert to df
-    df_all_game_points = pd.DataFrame(new_round_values).replace("", 0)
-
-    # extract all player names
-    names = pd.unique(df_all_game_points[["Player 1", "Player 2"]].values.ravel("K"))
-
-    for name in names:
-        filtered_player_one = df_all_game_points[
-            df_all_game_points["Player 1"] == name
-        ].filter(like="P1")
-        filtered_player_two = df_all_game_points[
-            df_all_game_points["Player 2"] == name
-        ].filter(like="P2")
-        filtered_player_gp = df_all_game_points[
-            (df_all_game_points["Player 2"] == name)
-            | (df_all_game_points["Player 1"] == name)
-        ].filter(like="GP")
-
-        # Step 2: Select columns containing 'gp' for every player
-
-        sum_p1 = filtered_player_one.astype(int).sum().sum()
-        sum_p2 = filtered_player_two.astype(int).sum().sum()
-        sum_gp = filtered_player_gp.astype(int).sum().sum() * 0.9
-
-        # add points to existing round table
-        for row in current_round_table:
-            if row["Player"] == name:
-                row["personal points"] = sum_p1 + sum_p2
-                row["game points"] = sum_gp
-                row["total points"] = sum_p1 + sum_p2 + sum_gp
-
-    return current_round_table, None
-
-
-def collect_and_update_cat_points(new_round_table, current_cat_table):
-    # flatten incoming list
-    new_round_table = list(itertools.chain.from_iterable(new_round_table))
-
-    player_points = defaultdict(int)
-    for row in new_round_table:
-        player_points[row["Player"]] += row["total points"]
-
-    for i, row in enumerate(current_cat_table):
-        for player, points in player_points.items():
-            if row["Apelido"] == player:
-                current_cat_table[i]["Points"] = points
-    return current_cat_table
-
-
-def _check_best_players(df, n_winners):
-    # get top n players from total points
-    top_players = df.nlargest(n_winners, "total points")
-    bot_players = df.nsmallest(len(df) - n_winners, "total points")
-    # get the worst of the best
-    worst_of_the_best = top_players["total points"].min()
-    # get all players with the same points as the worst of the best
-    tied_edge_cases = bot_players[bot_players["total points"] == worst_of_the_best]
-    if len(tied_edge_cases) > 0:
-        all_tied_edge_cases = df[df["total points"] == worst_of_the_best]
-        # remove all tied edge cases from the top players
-        top_players = top_players[
-            ~top_players["Player"].isin(all_tied_edge_cases["Player"])
+def save_chave_table(table_data, table_id, no_of_winners, session_id):
+    """
+    The only server callback of a chave table edit: saves the table and
+    updates the tiebreaker of its round in the same response. The round and
+    category points are summed up in the browser.
+    """
+    if _session_expired(session_id):
+        return
+    entered_table_data = table_data
+    old_table_data, table_data = store_chave_table(session_id, table_id, table_data)
+
+    # cells like "3+4+5" are parsed once here, the table gets the points back
+    # so it only holds numbers. Plain numbers are not sent back again.
+    if _cell_texts(entered_table_data) != _cell_texts(table_data):
+        set_props(table_id, {"data": table_data})
+    if old_table_data == table_data:
+        # nothing changed, e.g. the table with the parsed points came back
+        return
+
+    # only the changed cells go to the journal
+    _session_journal(session_id).extend(
+        [
+            [
+                "score",
+                table_id["index"],
+                table_id["round"],
+                table_id["chave"],
+                table_id["game_type"],
+                row_index,
+                column,
+                value,
+            ]
+            for row_index, (old_row, new_row) in enumerate(
+                zip(old_table_data, table_data)
+            )
+            for column, value in new_row.items()
+            if old_row.get(column) != value
         ]
-    else:
-        all_tied_edge_cases = None
-
-    return top_players, all_tied_edge_cases
-
-
-def check_ties_in_round(current_round_table, no_of_winners):
-    round_df = pd.DataFrame(current_round_table)
-    # check for ties if more people are present then there are winners
-    if len(round_df) > no_of_winners:
-        top_players, all_tied_edge_cases = _check_best_players(round_df, no_of_winners)
-
-        if all_tied_edge_cases is not None:
-            if len(top_players) == no_of_winners - 1:
-                # case where only one spot is uncertain
-                return all_tied_edge_cases["Player"].values
-            else:
-                # case where more than one spot is uncertain
-                return [
-                    "There is more then one tiebreaker needed, please manually add points to the tied players: "
-                    + ", ".join(all_tied_edge_cases["Player"].values)
-                ]
+    )
+
+    # the points are stored, save them before anything else can fail
+    _save_later(session_id)
 
-    return ["No tiebreaker needed"]
+    # changed points invalidate the chosen tiebreaker
+    _set_tiebreaker(
+        {"round": table_id["round"], "index": table_id["index"]},
+        *_find_ties_in_round(
+            session_id, table_id["index"], table_id["round"], no_of_winners
+        ),
+    )
 
 
-def enable_next_round_button(tie_breaker_check, n_clicks_new_round):
-    if n_clicks_new_round is not None and n_clicks_new_round > 0:
-        return True, "new Round already started"
+def _advancing_players(ranking, no_of_winners):
+    """
+    Split a ranking (see get_round_ranking) after no_of_winners players.
 
-    elif tie_breaker_check is None:
-        return True, "Check the tiebreaker box before starting a new round"
+    Returns the players that advance for sure, the tie that crosses the cut
+    (None if there is none) and how many players of the tie still advance.
+    """
+    for tie in ranking["ties"]:
+        first_rank = tie["rank"]
+        last_rank = first_rank + len(tie["players"]) - 1
+        if first_rank <= no_of_winners < last_rank:
+            top_players = [
+                name for name in ranking["order"] if ranking["ranks"][name] < first_rank
+            ]
+            return top_players, tie, no_of_winners - first_rank + 1
+    return ranking["order"][:no_of_winners], None, 0
 
-    elif "There is more then one tiebreaker needed" in tie_breaker_check:
-        return True, tie_breaker_check
 
-    else:
-        return False, ""
+def _find_ties_in_round(session_id, category, round, no_of_winners):
+    """
+    Return the tiebreaker options of a round and how many of the tied players
+    still advance (0 if there is no tie).
+
+    Players with the same points are ranked by the tie break keys of the
+    category, only players that are equal in all of them are a tie. The
+    operator chooses which of the tied players take the open spots.
+    """
+    if no_of_winners is None:
+        # nothing chosen in the advance dropdown (yet)
+        return [], 0
+    ranking = get_round_ranking(session_id, category, round)
+    _, tie, open_spots = _advancing_players(ranking, no_of_winners)
+    if tie is None:
+        return ["No tiebreaker needed"], 0
+    return tie["players"], open_spots
+
+
+def _set_tiebreaker(round_id, options, open_spots):
+    # new options reset the chosen players
+    set_props(
+        {"type": "round_tie_breaker", **round_id}, {"options": options, "value": []}
+    )
+    set_props({"type": "round-open-spots", **round_id}, {"data": open_spots})
+
+
+def check_ties_in_round(no_of_winners, session_id):
+    if _session_expired(session_id):
+        return
+    round_id = ctx.triggered_id
+    _set_tiebreaker(
+        {"round": round_id["round"], "index": round_id["index"]},
+        *_find_ties_in_round(
+            session_id, round_id["index"], round_id["round"], no_of_winners
+        ),
+    )
+
+
+def _round_state(states, round):
+    # states is a ctx.states_list entry of an ALL state, not every round has to
+    # be rendered so the values are looked up by their round
+    for state in states:
+        if state["id"]["round"] == round:
+            return state.get("value")
 
 
 def start_new_round(
     n_clicks,
-    all_round_tables,
     no_of_winners,
     tiebreaker_names,
-    current_round_tabs,
     current_round_tab_id,
+    session_id,
 ):
-    # I think we only ever need to consider the last entry of these input lists as we are only ever adding one round at a time
-    # to make sure nothing wierd happens I should deactivate the all previous buttons and radio menus
-
     current_cat_id = current_round_tab_id["index"]
 
     # get current round number:
-    current_round = len(n_clicks)
-
-    current_round_table = all_round_tables[current_round - 1]
-    tiebreaker_name = tiebreaker_names[current_round - 1]
-    no_of_winners = no_of_winners[current_round - 1]
-
-    round_df = pd.DataFrame(current_round_table)
-    top_players, all_tied_edge_cases = _check_best_players(round_df, no_of_winners)
+    if ctx.triggered_id is None or not ctx.triggered[0]["value"]:
+        # the button was only added to the layout
+        raise PreventUpdate
+    if _session_expired(session_id):
+        return no_update, no_update
+    current_round = ctx.triggered_id["round"]
+    if current_round != max(get_rounds(session_id, current_cat_id)):
+        raise PreventUpdate
+
+    no_of_winners = _round_state(ctx.states_list[0], current_round)
+    tiebreaker_names = _round_state(ctx.states_list[1], current_round) or []
+    if no_of_winners is None:
+        raise PreventUpdate
 
     # advancing player_names
-    player_names = top_players["Player"].to_list()
-    if all_tied_edge_cases is not None:
-        player_names.append(tiebreaker_name)
-
-    player_per_shaves = 4
+    ranking = get_round_ranking(session_id, current_cat_id, current_round)
+    player_names, tie, open_spots = _advancing_players(ranking, no_of_winners)
+    if tie is not None:
+        # the tied players the operator chose for the open spots
+        chosen = [name for name in tie["players"] if name in tiebreaker_names]
+        if len(chosen) != open_spots:
+            raise PreventUpdate
+        player_names += chosen
+
+    scoring_rules = get_scoring_rules(session_id, current_cat_id)
     print(player_names)
-    shaves_dict, pairs_dict = create_round(player_names, player_per_shaves)
+    shaves_dict, pairs_dict = create_round(
+        player_names,
+        scoring_rules.chave_size,
+        scoring_rules.game_types,
+        round_rng(get_filename(session_id), current_cat_id, current_round + 1),
+        groups=get_player_groups(session_id, current_cat_id),
+        # no rematches of earlier chaves, the advancing players are seeded by
+        # their rank
+        history=get_category_chaves(session_id, current_cat_id),
+        seeded=True,
+    )
     print(shaves_dict)
+    _session_journal(session_id).append(
+        [
+            "round",
+            current_cat_id,
+            current_round + 1,
+            player_names,
+            shaves_dict,
+            pairs_dict,
+        ]
+    )
+    register_round(
+        session_id,
+        current_cat_id,
+        current_round + 1,
+        player_names,
+        shaves_dict,
+        pairs_dict,
+    )
+    _save_later(session_id)
     # create new round tab
-    new_tab = create_round_tab(
-        category=current_cat_id,
-        round_number=current_round + 1,
-        players=player_names,
-        shave_pairs=pairs_dict,
-        shave_names_dict=shaves_dict,
+    new_tab = _create_round_tab_from_state(
+        session_id, current_cat_id, current_round + 1
     )
 
-    current_round_tabs.append(new_tab)
+    # only the new tab is sent, the previous rounds stay in the browser
+    round_tabs_patch = Patch()
+    round_tabs_patch.append(new_tab)
+    rendered_rounds_patch = Patch()
+    rendered_rounds_patch.append(new_tab.value)
+
+    return round_tabs_patch, rendered_rounds_patch
+
+
+def render_round_tab(tab_value, rendered_rounds, session_id):
+    # round tabs are built from the state when they are opened the first time
+    if tab_value in rendered_rounds:
+        raise PreventUpdate
+    if _session_expired(session_id):
+        return no_update, no_update
+    category = ctx.triggered_id["index"]
+    round = int(tab_value.split("-")[1])
+    round_tab = _create_round_tab_from_state(
+        session_id,
+        category,
+        round,
+        finished=round < max(get_rounds(session_id, category)),
+    )
 
-    return current_round_tabs
+    round_tabs_patch = Patch()
+    round_tabs_patch[round - 1]["props"]["children"] = round_tab.children
+    rendered_rounds_patch = Patch()
+    rendered_rounds_patch.append(tab_value)
+    return round_tabs_patch, rendered_rounds_patch
+
+
+def render_game_type(active_game_type, rendered_game_types, session_id):
+    # same for the chave tables of a game type
+    if active_game_type is None or active_game_type in rendered_game_types:
+        raise PreventUpdate
+    if _session_expired(session_id):
+        return no_update, no_update
+    category, round = ctx.triggered_id["category"], ctx.triggered_id["round"]
+    round_info = get_round(session_id, category, round)
+    chave_cards = create_chave_cards(
+        category,
+        round,
+        round_info["chaves"],
+        active_game_type,
+        round_info["pairs"],
+        get_scoring_rules(session_id, category).table_columns,
+        get_round_tables(session_id, category, round),
+    )
+
+    game_types = round_shape(round_info["pairs"])[1]
+    accordion_patch = Patch()
+    accordion_patch[game_types.index(active_game_type)]["props"][
+        "children"
+    ] = chave_cards
+    rendered_game_types_patch = Patch()
+    rendered_game_types_patch.append(active_game_type)
+    return accordion_patch, rendered_game_types_patch
+
+
+def show_roda_schedule(n_rodas, session_id):
+    # plan the games of the round on the rodas (see app_schedule), more rodas
+    # than games are cut to one roda per game
+    if not n_rodas or n_rodas < 1:
+        return []
+    if _session_expired(session_id):
+        return no_update
+    category, round = ctx.triggered_id["index"], ctx.triggered_id["round"]
+    scoring_rules = get_scoring_rules(session_id, category)
+    schedule, total_minutes = schedule_round(
+        get_round(session_id, category, round)["pairs"],
+        int(n_rodas),
+        scoring_rules.game_minutes,
+        scoring_rules.rest_minutes,
+    )
+    return create_schedule_table(schedule, total_minutes)
 
 
 def _organize_games_table(all_games_tables, all_game_table_ids):
@@ -231,16 +795,28 @@ def _organize_games_table(all_games_tables, all_game_table_ids):
     return game_type_dict
 
 
-def generate_category_results(
-    n_clicks, all_games_tables, all_rounds_tables, all_game_table_ids
-):
-    # all games tables strucute: all_games_tables[game_type*round][game]
+# category -> (hash of the scores, results layout)
+_category_results = {}
+
+
+def _hash_category_scores(category_scores, scoring_rules):
+    content = hashlib.sha256()
+    content.update(json.dumps(scoring_rules.to_dict()).encode("utf8"))
+    for round, round_info, scores in category_scores:
+        content.update(json.dumps([round, round_info]).encode("utf8"))
+        content.update(scores.tobytes())
+    return content.hexdigest()
 
+
+def _create_category_results(session_id, category, category_scores):
     best_game_Layout = html.Div(children=[html.H2("Best Games for each category:")])
 
     # find the winners in category:
-    last_round_df = pd.DataFrame(all_rounds_tables[-1])
-    last_round_df.sort_values(by=["total points"], ascending=False, inplace=True)
+    last_round = category_scores[-1][0]
+    ranking = get_round_ranking(session_id, category, last_round)
+    last_round_df = pd.DataFrame(get_round_table(session_id, category, last_round))
+    last_round_df.insert(0, "Rank", last_round_df["Player"].map(ranking["ranks"]))
+    last_round_df = last_round_df.set_index("Player", drop=False).loc[ranking["order"]]
 
     last_round_table = dbc.Table.from_dataframe(
         last_round_df, striped=True, bordered=True, hover=True
@@ -248,70 +824,71 @@ def generate_category_results(
     best_game_Layout.children.append(html.H2("Category winners:"))
     best_game_Layout.children.append(last_round_table)
 
-    orgnaized_games_tables = _organize_games_table(all_games_tables, all_game_table_ids)
+    scoring_rules = get_scoring_rules(session_id, category)
 
-    for category, category_games in orgnaized_games_tables.items():
-        for game_type, game_type_games in category_games.items():
-            # concanate all games for one game type over all rounds tables
+    # all game types in the order they were played
+    category_game_types = dict.fromkeys(
+        game_type
+        for _, round_info, _ in category_scores
+        for game_type in round_shape(round_info["pairs"])[1]
+    )
+    for game_type in category_game_types:
+        # the P1, P2 and GP points of all games of the game type in all rounds
+        game_players, game_points = [], []
+        for _, round_info, scores in category_scores:
+            round_players, round_points = game_type_games(
+                scores, round_info["pairs"], game_type, scoring_rules
+            )
+            game_players.extend(round_players)
+            game_points.append(round_points)
+        game_points = np.concatenate(game_points)
+
+        # the best games are the ones with the highest GP
+        best = np.flatnonzero(game_points[:, 2] == game_points[:, 2].max())
+        best_games = pd.DataFrame(
+            {
+                "Player 1": [game_players[i][0] for i in best],
+                "Player 2": [game_players[i][1] for i in best],
+                "P1": game_points[best, 0],
+                "P2": game_points[best, 1],
+                "GP": game_points[best, 2],
+            }
+        )
 
-            total_game_type_df = pd.DataFrame()
-            for round, round_games in game_type_games.items():
-                for chave, chave_games in round_games.items():
-                    for game in chave_games:
-                        total_game_type_df = pd.concat([total_game_type_df, game])
+        # make dash table
+        new_table = dbc.Table.from_dataframe(
+            best_games, striped=True, bordered=True, hover=True
+        )
+        best_game_Layout.children.append(html.H2(f"Best {game_type} games:"))
+        best_game_Layout.children.append(new_table)
+    return best_game_Layout
 
-            df_for_game_type = pd.DataFrame()
-            df_for_game_type["GP"] = (
-                total_game_type_df["Ref1-GP"].values.astype(int)
-                + total_game_type_df["Ref2-GP"].values.astype(int)
-                + total_game_type_df["Ref3-GP"].values.astype(int)
-            )
-            df_for_game_type["P1"] = (
-                total_game_type_df["Ref1-P1"].values.astype(int)
-                + total_game_type_df["Ref2-P1"].values.astype(int)
-                + total_game_type_df["Ref3-P1"].values.astype(int)
-            )
-            df_for_game_type["P2"] = (
-                total_game_type_df["Ref1-P2"].values.astype(int)
-                + total_game_type_df["Ref2-P2"].values.astype(int)
-                + total_game_type_df["Ref3-P2"].values.astype(int)
-            )
-            df_for_game_type["Player 1"] = total_game_type_df["Player 1"].values
-            df_for_game_type["Player 2"] = total_game_type_df["Player 2"].values
 
-            best_game_points = df_for_game_type.nlargest(1, "GP")["GP"].values[0]
-            result_columns = ["Player 1", "Player 2", "P1", "P2", "GP"]
-            best_games = df_for_game_type[df_for_game_type["GP"] == best_game_points][
-                result_columns
-            ]
+def generate_category_results(n_clicks, session_id):
+    if _session_expired(session_id):
+        return no_update, no_update
+    category = ctx.triggered_id["index"]
+    category_scores = get_category_scores(session_id, category)
 
-            # make dash table
-            new_table = dbc.Table.from_dataframe(
-                best_games, striped=True, bordered=True, hover=True
-            )
-            best_game_Layout.children.append(html.H2(f"Best {game_type} games:"))
-            best_game_Layout.children.append(new_table)
+    # the results are only built again when a score changed
+    scores_hash = _hash_category_scores(
+        category_scores, get_scoring_rules(session_id, category)
+    )
+    cached_hash, best_game_Layout = _category_results.get(category, (None, None))
+    if cached_hash != scores_hash:
+        best_game_Layout = _create_category_results(
+            session_id, category, category_scores
+        )
+        _category_results[category] = (scores_hash, best_game_Layout)
     return True, best_game_Layout
 
 
-def save_everything_to_excl(all_games_tables, all_game_table_ids, filename):
-    def _dataframe_row_sep(separator):
-        df = pd.DataFrame()
-        df["Player 1"] = separator
-        df["Ref1-P1"] = separator
-        df["Ref1-GP"] = separator
-        df["Ref1-P2"] = separator
-        df["Ref2-P1"] = separator
-        df["Ref2-GP"] = separator
-        df["Ref2-P2"] = separator
-        df["Ref3-P1"] = separator
-        df["Ref3-GP"] = separator
-        df["Ref3-P2"] = separator
-        df["Player 2"] = separator
-        return df
-
+def save_everything_to_excl(session_id, file):
+    # writes all games of the session as excel to file (a path or a buffer)
     save_dict = {}
 
+    all_game_table_ids, all_games_tables = get_chave_tables(session_id)
+
     orgnaized_games_tables = _organize_games_table(all_games_tables, all_game_table_ids)
     for category, category_games in orgnaized_games_tables.items():
         list_of_df = []
@@ -331,10 +908,19 @@ def save_everything_to_excl(all_games_tables, all_game_table_ids, filename):
         save_dict[category] = total_cat_type_df
 
     # create excel file
-    print(filename)
-    filename = "Results_" + filename
-    with pd.ExcelWriter(filename, engine="openpyxl") as writer:
+    with pd.ExcelWriter(file, engine="openpyxl") as writer:
         for category, df in save_dict.items():
             df.to_excel(writer, sheet_name=category)
 
-    return None
+
+def export_results(n_clicks, session_id):
+    """
+    Download all games as excel file, the tournament itself is saved as
+    snapshot (see app_snapshot).
+    """
+    if _session_expired(session_id):
+        return no_update
+    return dcc.send_bytes(
+        lambda buffer: save_everything_to_excl(session_id, buffer),
+        "Results_" + get_filename(session_id),
+    )
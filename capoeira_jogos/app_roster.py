@@ -0,0 +1,157 @@
+"""
+Reading the player rosters of the uploaded excel file.
+
+Every sheet is a category. The first row is free text, the second row holds
+the column names and every following row is a player. The sheets are
+streamed with openpyxl in read only mode, the formatting is not loaded and
+empty rows and unnamed columns are skipped.
+"""
+
+import datetime
+import io
+import unicodedata
+
+from openpyxl import load_workbook
+
+# columns every sheet needs, Apelido may be empty for single players
+required_columns = ["Apelido", "Name"]
+header_row = 2
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _cell_value(value):
+    # the rows are kept as json, dates become text
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def read_roster_sheet(worksheet):
+    """
+    Return the rows of one sheet as dicts of the named columns and the
+    errors of the sheet. An empty Apelido is filled with the Vorname or the
+    Name, a player without any of them is an error.
+    """
+    rows, errors = [], []
+    columns = None
+    for row_number, values in enumerate(worksheet.iter_rows(values_only=True), 1):
+        if row_number < header_row:
+            continue
+        if row_number == header_row:
+            # remove whitespaces from column names, unnamed columns are skipped
+            columns = [
+                (position, str(name).strip())
+                for position, name in enumerate(values)
+                if not _is_empty(name)
+            ]
+            missing = [
+                column
+                for column in required_columns
+                if column not in [name for _, name in columns]
+            ]
+            if missing:
+                return [], [f"missing column {', '.join(missing)}"]
+            continue
+        if all(_is_empty(value) for value in values):
+            continue
+
+        row = {
+            name: _cell_value(values[position]) if position < len(values) else None
+            for position, name in columns
+        }
+        # fill empty appelido with first or last name
+        for name_column in ["Apelido", "Vorname", "Name"]:
+            if not _is_empty(row.get(name_column)):
+                row["Apelido"] = str(row[name_column])
+                break
+        else:
+            errors.append(f"row {row_number}: no Apelido, Vorname or Name")
+            continue
+        rows.append(row)
+
+    if columns is None:
+        return [], [f"missing column {', '.join(required_columns)}"]
+    return rows, errors
+
+
+def read_roster(file):
+    """
+    Read all sheets of an excel file (path or file object).
+
+    Returns {sheet name: rows} and {sheet name: errors} for the sheets that
+    have errors.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        categories, errors = {}, {}
+        for worksheet in workbook.worksheets:
+            # the stored dimensions of a sheet are not always right
+            worksheet.reset_dimensions()
+            rows, sheet_errors = read_roster_sheet(worksheet)
+            categories[worksheet.title] = rows
+            if sheet_errors:
+                errors[worksheet.title] = sheet_errors
+    finally:
+        workbook.close()
+    return categories, errors
+
+
+def _read_roster_content(content):
+    return read_roster(io.BytesIO(content))
+
+
+def read_rosters(contents):
+    """
+    Read several excel files (as bytes), see read_roster.
+    """
+    return [_read_roster_content(content) for content in contents]
+
+
+def normalized_name(row):
+    """
+    Return the name of a player without case, accents and extra whitespace,
+    the Apelido is used for players without Vorname and Name.
+    """
+    name = " ".join(
+        str(row[column])
+        for column in ["Vorname", "Name"]
+        if not _is_empty(row.get(column))
+    )
+    name = unicodedata.normalize("NFKD", name or str(row["Apelido"]))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(name.casefold().split())
+
+
+def merge_rosters(rosters):
+    """
+    Merge the categories of several files, sheets with the same name become
+    one category. A player that was already listed by an earlier file is
+    skipped, players are compared by normalized_name.
+
+    Returns {category: rows} with the columns of all files and
+    {category: [apelidos of the skipped players]}.
+    """
+    categories, merged = {}, {}
+    first_file = {}
+    for file_index, roster in enumerate(rosters):
+        for category, rows in roster.items():
+            category_rows = categories.setdefault(category, [])
+            for row in rows:
+                name = normalized_name(row)
+                if first_file.setdefault((category, name), file_index) != file_index:
+                    merged.setdefault(category, []).append(row["Apelido"])
+                    continue
+                category_rows.append(row)
+
+    # every row gets all columns of its category
+    for category, rows in categories.items():
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        categories[category] = [
+            {column: row.get(column) for column in columns} for row in rows
+        ]
+    return categories, merged
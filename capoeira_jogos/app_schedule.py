@@ -0,0 +1,118 @@
+"""
+Schedule of the games of a round on the rodas.
+
+The games are planned with list scheduling: the roda that is free first
+gets the game that can start earliest, ties go to the chave with the most
+play time left. A chave plays its game types in order and every player
+gets a rest between two games.
+"""
+
+from app_scoring import round_shape
+
+
+def game_duration(game_minutes, game_type):
+    # game_minutes is the same for all game types or {game_type: minutes}
+    if isinstance(game_minutes, dict):
+        return game_minutes[game_type]
+    return game_minutes
+
+
+def max_rodas(pairs):
+    # more rodas than games of the round stay empty
+    return max(
+        sum(
+            "Placeholder" not in game
+            for chave_pairs in pairs.values()
+            for games in chave_pairs.values()
+            for game in games
+        ),
+        1,
+    )
+
+
+def schedule_round(pairs, n_rodas, game_minutes, rest_minutes=0):
+    """
+    Plan the games of a round (pairs: chave -> game type -> [(player 1,
+    player 2)]) on n_rodas rodas.
+
+    Returns the planned games sorted by start as dicts with roda, start and
+    end (minutes from the start of the round), chave, game type and the
+    players, and the total minutes of the round.
+    """
+    n_rodas = min(max(n_rodas, 1), max_rodas(pairs))
+    chaves, game_types, _ = round_shape(pairs)
+    # games that still have to be played: chave -> game type -> games
+    open_games = {
+        chave: [
+            [game for game in pairs[chave][game_type] if "Placeholder" not in game]
+            for game_type in game_types
+        ]
+        for chave in chaves
+    }
+    chave_minutes = {
+        chave: sum(
+            len(games) * game_duration(game_minutes, game_type)
+            for game_type, games in zip(game_types, open_games[chave])
+        )
+        for chave in chaves
+    }
+    # the game type a chave plays and when its last game type ended
+    current_type = {chave: 0 for chave in chaves}
+    type_end = {chave: 0 for chave in chaves}
+    running_end = {chave: 0 for chave in chaves}
+    player_free = {}
+    roda_free = [0] * n_rodas
+    schedule = []
+
+    def next_type(chave):
+        # move on to the next game type with games once all games of the
+        # current one are planned
+        while (
+            current_type[chave] < len(game_types)
+            and not open_games[chave][current_type[chave]]
+        ):
+            current_type[chave] += 1
+            type_end[chave] = running_end[chave]
+
+    for chave in chaves:
+        next_type(chave)
+
+    while any(current_type[chave] < len(game_types) for chave in chaves):
+        roda = min(range(n_rodas), key=roda_free.__getitem__)
+        best = None
+        for chave_index, chave in enumerate(chaves):
+            if current_type[chave] == len(game_types):
+                continue
+            for game_index, game in enumerate(open_games[chave][current_type[chave]]):
+                ready = max(
+                    [roda_free[roda], type_end[chave]]
+                    + [player_free.get(player, 0) for player in game]
+                )
+                # earliest start first, then the chave with most time left
+                key = (ready, -chave_minutes[chave], chave_index, game_index)
+                if best is None or key < best[0]:
+                    best = (key, chave, game_index)
+
+        (start, *_), chave, game_index = best
+        game_type = game_types[current_type[chave]]
+        player_1, player_2 = open_games[chave][current_type[chave]].pop(game_index)
+        end = start + game_duration(game_minutes, game_type)
+        schedule.append(
+            {
+                "roda": roda + 1,
+                "start": start,
+                "end": end,
+                "chave": chave,
+                "game_type": game_type,
+                "Player 1": player_1,
+                "Player 2": player_2,
+            }
+        )
+        roda_free[roda] = end
+        player_free[player_1] = player_free[player_2] = end + rest_minutes
+        chave_minutes[chave] -= end - start
+        running_end[chave] = max(running_end[chave], end)
+        next_type(chave)
+
+    schedule.sort(key=lambda game: (game["start"], game["roda"]))
+    return schedule, max((game["end"] for game in schedule), default=0)
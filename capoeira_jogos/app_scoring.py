@@ -0,0 +1,448 @@
+"""
+The points of a round are kept in one integer array with the axes
+chave x game type x game x referee x (P1, P2, GP).
+
+The chave tables shown in the app are only views of this array, all point
+totals are sums over its axes. How many referees there are and how their
+points are weighted is set by the ScoringRules of the category.
+"""
+
+import json
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+
+score_types = ["P1", "P2", "GP"]
+# the keys players can be ranked by, see rank_players
+ranking_keys = ["total", "game", "personal", "head_to_head", "best_game"]
+
+
+class ScoringRules:
+    """
+    The scoring rules of a category: the referee panel, how much every
+    referee and the game points count, the game types of a round and the
+    size of the chaves, the keys players are ranked by (see rank_players)
+    the roster columns that keep players apart (see app_chaves) and the
+    length of the games (see app_schedule).
+
+    Everything the scoring functions need (score columns, column index,
+    weight vector) is compiled once when the rules are created.
+    """
+
+    def __init__(
+        self,
+        referees=3,
+        game_point_factor=0.9,
+        game_types=("Sao Bento", "Benguela", "Iuna", "Angola"),
+        chave_size=4,
+        referee_weights=None,
+        tie_break_keys=("total", "game", "personal", "head_to_head", "best_game"),
+        separate_by=("Gruppe", "Grupo", "Group", "Academy", "Academia"),
+        game_minutes=2,
+        rest_minutes=2,
+    ):
+        if referee_weights is None:
+            referee_weights = [1] * referees
+        if referees < 1 or len(referee_weights) != referees:
+            raise ValueError("Every referee needs exactly one weight")
+        if not 3 <= chave_size <= 8 or not game_types:
+            raise ValueError("Chaves need 3 to 8 players and at least one game type")
+        unknown_keys = set(tie_break_keys) - set(ranking_keys)
+        if unknown_keys:
+            raise ValueError(f"Unknown tie break keys: {sorted(unknown_keys)}")
+
+        self.game_point_factor = game_point_factor
+        self.game_types = list(game_types)
+        self.chave_size = chave_size
+        self.tie_break_keys = list(tie_break_keys)
+        # roster columns (e.g. the academy), players with the same value are
+        # put into different chaves where possible
+        self.separate_by = list(separate_by)
+        # minutes of a game (or {game_type: minutes}) and the rest a player
+        # gets between two games, used to plan the rodas (see app_schedule)
+        self.game_minutes = game_minutes
+        self.rest_minutes = rest_minutes
+
+        # compiled
+        self.referees = [f"Ref{i + 1}" for i in range(referees)]
+        self.referee_weights = np.array(referee_weights)
+        # the score columns of a chave table in the order of the score array
+        self.score_columns = [
+            f"{referee}-{score_type}"
+            for referee in self.referees
+            for score_type in score_types
+        ]
+        # column -> (referee, score type) position in the score array
+        self.column_index = {
+            column: divmod(i, len(score_types))
+            for i, column in enumerate(self.score_columns)
+        }
+        # the score columns can be edited, the colors of the columns are set
+        # for all chave tables in assets/chave_tables.css
+        self.table_columns = (
+            [{"name": "Player 1", "id": "Player 1"}]
+            + [
+                {"name": column, "id": column, "editable": True}
+                for column in self.score_columns
+            ]
+            + [{"name": "Player 2", "id": "Player 2"}]
+        )
+
+    def to_dict(self):
+        return {
+            "referees": len(self.referees),
+            "game_point_factor": self.game_point_factor,
+            "game_types": self.game_types,
+            "chave_size": self.chave_size,
+            "referee_weights": self.referee_weights.tolist(),
+            "tie_break_keys": self.tie_break_keys,
+            "separate_by": self.separate_by,
+            "game_minutes": self.game_minutes,
+            "rest_minutes": self.rest_minutes,
+        }
+
+    @classmethod
+    def from_dict(cls, config):
+        # rules are stored as dicts, every config is only compiled once
+        key = json.dumps(config, sort_keys=True)
+        if key not in _compiled_rules:
+            _compiled_rules[key] = cls(**config)
+        return _compiled_rules[key]
+
+    def sum_referees(self, scores):
+        """
+        Return the weighted sum over the referees of a score array, i.e. the
+        P1, P2 and GP points of every game.
+        """
+        return np.tensordot(scores, self.referee_weights, axes=([-2], [0]))
+
+    def column_weights(self):
+        """
+        Return {column: [score type, referee weight]} of all score columns, so
+        the browser sums the tables like sum_referees.
+        """
+        return {
+            column: [score_type, self.referee_weights[referee].item()]
+            for column, (referee, score_type) in self.column_index.items()
+        }
+
+
+_compiled_rules = {}
+_scoring_rules = ScoringRules()
+_category_scoring_rules = {}
+
+
+def set_scoring_rules(scoring_rules=None, category_scoring_rules=None):
+    """
+    Set the rules new categories are scored with. category_scoring_rules maps
+    category -> ScoringRules for categories with a different panel.
+    """
+    global _scoring_rules, _category_scoring_rules
+    _scoring_rules = scoring_rules or ScoringRules()
+    _category_scoring_rules = dict(category_scoring_rules or {})
+
+
+def scoring_rules_for(category):
+    return _category_scoring_rules.get(category, _scoring_rules)
+
+
+def scoring_config():
+    # all rules as json, e.g. to notice when they changed
+    return {
+        "default": _scoring_rules.to_dict(),
+        "categories": {
+            category: scoring_rules.to_dict()
+            for category, scoring_rules in _category_scoring_rules.items()
+        },
+    }
+
+
+# a sum of whole numbers like "3+4+5", the referees add up their points in
+# the cells. Only ascii digits and numbers of up to 6 digits, like in
+# round_points.js, larger numbers are typos and would not fit the score array.
+max_cell_points = 999999
+_points_expression = re.compile(r"\s*[+-]?\s*[0-9]{1,6}(?:\s*[+-]\s*[0-9]{1,6})*\s*")
+_points_term = re.compile(r"([+-]?)\s*([0-9]+)")
+
+
+@lru_cache(maxsize=4096)
+def parse_points(text):
+    """
+    Return the points of a cell text as int. Only sums and differences of
+    whole numbers are allowed, anything else counts as 0.
+    """
+    if _points_expression.fullmatch(text) is None:
+        return 0
+    return sum(
+        -int(number) if sign == "-" else int(number)
+        for sign, number in _points_term.findall(text)
+    )
+
+
+def cell_points(value):
+    # cells that were not filled in count as 0
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str):
+        return parse_points(value)
+    if not math.isfinite(value) or abs(value) > max_cell_points:
+        return 0
+    return int(value)
+
+
+def round_shape(pairs):
+    """
+    Return the chaves, the game types and the most games of one chave and game
+    type of a round. pairs maps chave -> game type -> [(player 1, player 2)].
+    """
+    chaves = list(pairs)
+    game_types = list(pairs[chaves[0]]) if chaves else []
+    n_games = max(
+        (
+            len(game_type_pairs)
+            for chave_pairs in pairs.values()
+            for game_type_pairs in chave_pairs.values()
+        ),
+        default=0,
+    )
+    return chaves, game_types, n_games
+
+
+def new_round_scores(pairs, scoring_rules):
+    """
+    Return the empty score array of a round. Chaves with fewer games than the
+    largest one keep zeros in the unused games.
+    """
+    chaves, game_types, n_games = round_shape(pairs)
+    return np.zeros(
+        (
+            len(chaves),
+            len(game_types),
+            n_games,
+            len(scoring_rules.referees),
+            len(score_types),
+        ),
+        dtype=np.int64,
+    )
+
+
+def _table_index(pairs, chave, game_type):
+    chaves, game_types, _ = round_shape(pairs)
+    return chaves.index(chave), game_types.index(game_type)
+
+
+def get_table_rows(scores, pairs, chave, game_type, scoring_rules):
+    """
+    Return the rows of one chave table as shown in the app.
+    """
+    table_scores = scores[_table_index(pairs, chave, game_type)]
+    rows = []
+    for game, (player_1, player_2) in enumerate(pairs[chave][game_type]):
+        row = {"Player 1": player_1}
+        row.update(
+            zip(scoring_rules.score_columns, table_scores[game].ravel().tolist())
+        )
+        row["Player 2"] = player_2
+        rows.append(row)
+    return rows
+
+
+def set_table_rows(scores, pairs, chave, game_type, table_rows, scoring_rules):
+    """
+    Write the points of the rows of one chave table into the score array.
+    """
+    table_points = np.array(
+        [
+            [cell_points(row[column]) for column in scoring_rules.score_columns]
+            for row in table_rows
+        ],
+        dtype=np.int64,
+    ).reshape(len(table_rows), len(scoring_rules.referees), len(score_types))
+    scores[_table_index(pairs, chave, game_type)][: len(table_rows)] = table_points
+
+
+def set_cell(scores, pairs, chave, game_type, row, column, value, scoring_rules):
+    referee, score_type = scoring_rules.column_index[column]
+    if row >= len(pairs[chave][game_type]):
+        raise IndexError(row)
+    scores[_table_index(pairs, chave, game_type)][row, referee, score_type] = (
+        cell_points(value)
+    )
+
+
+def round_player_index(pairs, players):
+    """
+    Return the position in players of both players of every game as an array
+    chave x game type x game x 2. Placeholders and unused games are -1.
+    """
+    chaves, game_types, n_games = round_shape(pairs)
+    player_index = {name: i for i, name in enumerate(players) if name != "Placeholder"}
+    index = np.full((len(chaves), len(game_types), n_games, 2), -1)
+    for c, chave in enumerate(chaves):
+        for g, game_type in enumerate(game_types):
+            for game, pair in enumerate(pairs[chave][game_type]):
+                index[c, g, game] = [player_index.get(name, -1) for name in pair]
+    return index
+
+
+def sum_player_points(scores, player_index, n_players, scoring_rules):
+    """
+    Return the personal and (unweighted) game points of every player of a
+    round as two arrays, indexed like the players of the round. They are
+    integers unless a referee weight is not.
+    """
+    # sum over the referees: chave x game type x game x (P1, P2, GP)
+    game_sums = scoring_rules.sum_referees(scores)
+    personal = np.zeros(n_players, dtype=game_sums.dtype)
+    game = np.zeros(n_players, dtype=game_sums.dtype)
+    for side in (0, 1):
+        side_index = player_index[..., side]
+        played = side_index >= 0
+        personal += np.bincount(
+            side_index[played], game_sums[..., side][played], minlength=n_players
+        ).astype(game_sums.dtype)
+        game += np.bincount(
+            side_index[played], game_sums[..., 2][played], minlength=n_players
+        ).astype(game_sums.dtype)
+    return personal, game
+
+
+def games_played(player_index, n_players):
+    """
+    Return how many games every player of a round plays.
+    """
+    return np.bincount(player_index[player_index >= 0], minlength=n_players)
+
+
+def per_game(points, games):
+    # players of chaves with an odd number of players do not play every game
+    # type, they are compared by their points per game
+    return points / np.maximum(games, 1)
+
+
+def weight_points(personal, game, scoring_rules):
+    game = game * scoring_rules.game_point_factor
+    return personal, game, personal + game
+
+
+def _best_game(game_sums, player_index, n_players, scoring_rules):
+    # the most points (personal + weighted game points) of every player in a
+    # single game
+    best = np.full(n_players, -np.inf)
+    for side in (0, 1):
+        side_index = player_index[..., side]
+        played = side_index >= 0
+        side_points = (
+            game_sums[..., side] + game_sums[..., 2] * scoring_rules.game_point_factor
+        )
+        np.maximum.at(best, side_index[played], side_points[played])
+    best[np.isinf(best)] = 0
+    return best
+
+
+def _head_to_head(game_sums, player_index, n_players, groups):
+    # the personal points a player scored more than their opponents in the
+    # games against players of the same group
+    player_1, player_2 = player_index[..., 0], player_index[..., 1]
+    played = (player_1 >= 0) & (player_2 >= 0)
+    player_1, player_2 = player_1[played], player_2[played]
+    margin = (game_sums[..., 0] - game_sums[..., 1])[played]
+    same_group = groups[player_1] == groups[player_2]
+    return np.bincount(
+        player_1[same_group], margin[same_group], minlength=n_players
+    ) - np.bincount(player_2[same_group], margin[same_group], minlength=n_players)
+
+
+def rank_players(scores, player_index, n_players, scoring_rules):
+    """
+    Rank the players of a round by the tie break keys of the scoring rules,
+    players with the same points in the first key are ranked by the next one
+    and so on. total, game and personal are the points per game played, in
+    a chave with an odd number of players not everybody plays every game
+    type.
+
+    head_to_head only counts the games between players that are tied in all
+    keys before it. Returns the order of the players (best first), the rank
+    of every player and the groups of players that are still tied in all
+    keys as [(rank, player indices)]. Tied players share their rank
+    (1, 2, 2, 4) and keep their order in the players of the round.
+    """
+    game_sums = scoring_rules.sum_referees(scores)
+    personal, game = sum_player_points(scores, player_index, n_players, scoring_rules)
+    _, game, total = weight_points(personal, game, scoring_rules)
+    games = games_played(player_index, n_players)
+
+    keys = np.zeros((0, n_players))
+    for key in scoring_rules.tie_break_keys:
+        if key == "head_to_head":
+            # players that are equal in all keys so far form a group
+            groups = np.unique(keys.T, axis=0, return_inverse=True)[1].ravel()
+            values = _head_to_head(game_sums, player_index, n_players, groups)
+        elif key == "best_game":
+            values = _best_game(game_sums, player_index, n_players, scoring_rules)
+        else:
+            values = per_game(
+                {"total": total, "game": game, "personal": personal}[key], games
+            )
+        # weighted points are floats, equal points must compare equal
+        keys = np.vstack([keys, np.round(values, 9)])
+
+    # lexsort is stable, sorts by the last key first and ascending
+    order = np.lexsort(-keys[::-1]) if len(keys) else np.arange(n_players)
+    sorted_keys = keys[:, order]
+    new_rank = np.ones(n_players, dtype=bool)
+    new_rank[1:] = (sorted_keys[:, 1:] != sorted_keys[:, :-1]).any(axis=0)
+    sorted_ranks = np.maximum.accumulate(
+        np.where(new_rank, np.arange(1, n_players + 1), 0)
+    )
+    ranks = np.empty(n_players, dtype=np.int64)
+    ranks[order] = sorted_ranks
+
+    ties = [
+        (int(sorted_ranks[group[0]]), order[group])
+        for group in np.split(np.arange(n_players), np.flatnonzero(new_rank)[1:])
+        if len(group) > 1
+    ]
+    return order, ranks, ties
+
+
+def table_contributions(scores, pairs, scoring_rules):
+    """
+    Return the personal and game points and the number of games every chave
+    table adds to its players as
+    {chave: {game_type: {player: [personal, game, games]}}}.
+    """
+    chaves, game_types, _ = round_shape(pairs)
+    game_sums = scoring_rules.sum_referees(scores).tolist()
+    contributions = {}
+    for c, chave in enumerate(chaves):
+        for g, game_type in enumerate(game_types):
+            contribution = {}
+            for game, (player_1, player_2) in enumerate(pairs[chave][game_type]):
+                sum_p1, sum_p2, sum_gp = game_sums[c][g][game]
+                for name, personal in [(player_1, sum_p1), (player_2, sum_p2)]:
+                    player_points = contribution.setdefault(name, [0, 0, 0])
+                    player_points[0] += personal
+                    player_points[1] += sum_gp
+                    player_points[2] += 1
+            contributions.setdefault(chave, {})[game_type] = contribution
+    return contributions
+
+
+def game_type_games(scores, pairs, game_type, scoring_rules):
+    """
+    Return the players and the summed P1, P2 and GP points of all games of one
+    game type in a round, in the order of the chave tables.
+    """
+    chaves, game_types, _ = round_shape(pairs)
+    if game_type not in game_types:
+        return [], np.zeros((0, len(score_types)), dtype=np.int64)
+    game_sums = scoring_rules.sum_referees(scores[:, game_types.index(game_type)])
+    game_players, game_points = [], []
+    for c, chave in enumerate(chaves):
+        game_type_pairs = pairs[chave][game_type]
+        game_players.extend(game_type_pairs)
+        game_points.append(game_sums[c, : len(game_type_pairs)])
+    return game_players, np.concatenate(game_points)
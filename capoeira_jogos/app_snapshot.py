@@ -0,0 +1,234 @@
+"""
+Snapshot of a whole tournament in a single SQLite file.
+
+The snapshot holds the roster, the rounds with their chaves and pairings
+and all entered points in plain tables, so it can be loaded back into the
+app (or read with any SQLite tool). Points are stored sparse, every cell of
+a chave table that is not 0 is one row of the points table.
+"""
+
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from app_backup import atomic_path
+from app_scoring import ScoringRules, new_round_scores, round_shape, score_types
+from app_state import (
+    get_file_owner,
+    get_filename,
+    get_rounds,
+    get_round_scores,
+    get_scoring_rules,
+    get_state_store,
+    register_category,
+    register_filename,
+    register_round,
+)
+
+snapshot_version = 1
+# the first bytes of every SQLite file
+sqlite_header = b"SQLite format 3\x00"
+
+_schema = """
+CREATE TABLE tournament (filename TEXT, version INTEGER);
+CREATE TABLE categories (category TEXT, rules TEXT);
+CREATE TABLE players (category TEXT, apelido TEXT, roster_row TEXT);
+CREATE TABLE rounds (category TEXT, round INTEGER, apelido TEXT);
+CREATE TABLE chaves (category TEXT, round INTEGER, chave TEXT, apelido TEXT);
+CREATE TABLE pairings (
+    category TEXT, round INTEGER, chave TEXT, game_type TEXT, game INTEGER,
+    player_1 TEXT, player_2 TEXT
+);
+CREATE TABLE points (
+    category TEXT, round INTEGER, chave TEXT, game_type TEXT, game INTEGER,
+    referee TEXT, score_type TEXT, points INTEGER
+);
+"""
+
+
+def snapshot_path(filename):
+    return "Tournament_" + os.path.splitext(filename)[0] + ".sqlite"
+
+
+def is_snapshot(content):
+    return content.startswith(sqlite_header)
+
+
+def _categories(session_id):
+    return [key[1] for key, _ in get_state_store().items(session_id, ("category",))]
+
+
+def write_snapshot(session_id, path):
+    """
+    Write the tournament of a session to a new SQLite file at path.
+    """
+    store = get_state_store()
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            connection.executescript(_schema)
+            connection.execute(
+                "INSERT INTO tournament VALUES (?, ?)",
+                (get_filename(session_id), snapshot_version),
+            )
+            for category in _categories(session_id):
+                scoring_rules = get_scoring_rules(session_id, category)
+                connection.execute(
+                    "INSERT INTO categories VALUES (?, ?)",
+                    (category, json.dumps(scoring_rules.to_dict())),
+                )
+                connection.executemany(
+                    "INSERT INTO players VALUES (?, ?, ?)",
+                    (
+                        (category, row["Apelido"], json.dumps(row))
+                        for row in store.get(session_id, ("category", category))
+                    ),
+                )
+                for round in get_rounds(session_id, category):
+                    _write_round(connection, session_id, category, round, scoring_rules)
+    finally:
+        connection.close()
+
+
+def _write_round(connection, session_id, category, round, scoring_rules):
+    round_info, scores = get_round_scores(session_id, category, round)
+    pairs = round_info["pairs"]
+    connection.executemany(
+        "INSERT INTO rounds VALUES (?, ?, ?)",
+        ((category, round, player) for player in round_info["players"]),
+    )
+    connection.executemany(
+        "INSERT INTO chaves VALUES (?, ?, ?, ?)",
+        (
+            (category, round, chave, player)
+            for chave, players in round_info["chaves"].items()
+            for player in players
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO pairings VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (category, round, chave, game_type, game, player_1, player_2)
+            for chave, chave_pairs in pairs.items()
+            for game_type, games in chave_pairs.items()
+            for game, (player_1, player_2) in enumerate(games)
+        ),
+    )
+    chaves, game_types, _ = round_shape(pairs)
+    # only the cells with points
+    index = np.nonzero(scores)
+    connection.executemany(
+        "INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                category,
+                round,
+                chaves[c],
+                game_types[g],
+                game,
+                scoring_rules.referees[referee],
+                score_types[score_type],
+                points,
+            )
+            for c, g, game, referee, score_type, points in zip(
+                *[axis.tolist() for axis in index], scores[index].tolist()
+            )
+        ),
+    )
+
+
+def save_snapshot(session_id):
+    # called by the autosaver thread, not by a dash callback
+    filename = get_filename(session_id)
+    if filename is None or get_file_owner(filename) not in (None, session_id):
+        # the session was removed from the state store in the meantime or
+        # the file was uploaded in another browser, that session writes it
+        return
+    with atomic_path(snapshot_path(filename)) as tmp_path:
+        write_snapshot(session_id, tmp_path)
+
+
+def read_snapshot(path, session_id):
+    """
+    Load the tournament of a snapshot into a session. Returns the categories.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        ((filename, version),) = connection.execute("SELECT * FROM tournament")
+        if version != snapshot_version:
+            raise ValueError(f"Unknown snapshot version {version}")
+        register_filename(session_id, filename)
+
+        categories = connection.execute("SELECT * FROM categories ORDER BY rowid")
+        categories = [
+            (category, ScoringRules.from_dict(json.loads(rules)))
+            for category, rules in categories.fetchall()
+        ]
+        for category, scoring_rules in categories:
+            rows = connection.execute(
+                "SELECT roster_row FROM players WHERE category = ? ORDER BY rowid",
+                (category,),
+            )
+            register_category(
+                session_id,
+                category,
+                [json.loads(row) for row, in rows],
+                scoring_rules,
+            )
+            rounds = connection.execute(
+                "SELECT DISTINCT round FROM rounds WHERE category = ? ORDER BY round",
+                (category,),
+            )
+            for (round,) in rounds.fetchall():
+                _read_round(connection, session_id, category, round, scoring_rules)
+    finally:
+        connection.close()
+    return [category for category, _ in categories]
+
+
+def _read_round(connection, session_id, category, round, scoring_rules):
+    query_args = (category, round)
+    players = [
+        player
+        for player, in connection.execute(
+            "SELECT apelido FROM rounds WHERE category = ? AND round = ? "
+            "ORDER BY rowid",
+            query_args,
+        )
+    ]
+    chaves = {}
+    for chave, player in connection.execute(
+        "SELECT chave, apelido FROM chaves WHERE category = ? AND round = ? "
+        "ORDER BY rowid",
+        query_args,
+    ):
+        chaves.setdefault(chave, []).append(player)
+    # every chave plays all game types of the rules, see create_round
+    pairs = {
+        chave: {game_type: [] for game_type in scoring_rules.game_types}
+        for chave in chaves
+    }
+    for chave, game_type, player_1, player_2 in connection.execute(
+        "SELECT chave, game_type, player_1, player_2 FROM pairings "
+        "WHERE category = ? AND round = ? ORDER BY rowid",
+        query_args,
+    ):
+        pairs[chave][game_type].append((player_1, player_2))
+
+    scores = new_round_scores(pairs, scoring_rules)
+    chave_names, game_types, _ = round_shape(pairs)
+    for chave, game_type, game, referee, score_type, points in connection.execute(
+        "SELECT chave, game_type, game, referee, score_type, points FROM points "
+        "WHERE category = ? AND round = ?",
+        query_args,
+    ):
+        scores[
+            chave_names.index(chave),
+            game_types.index(game_type),
+            game,
+            scoring_rules.referees.index(referee),
+            score_types.index(score_type),
+        ] = points
+    register_round(session_id, category, round, players, chaves, pairs, scores)
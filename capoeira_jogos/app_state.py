@@ -0,0 +1,537 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from app_scoring import (
+    new_round_scores,
+    get_table_rows,
+    set_table_rows,
+    round_player_index,
+    sum_player_points,
+    games_played,
+    per_game,
+    weight_points,
+    table_contributions,
+    rank_players,
+    ScoringRules,
+)
+
+
+class MemoryStateStore:
+    """
+    Keeps the tournament state of every session in a python dict.
+
+    Keys are tuples like ("table", category, round, chave, game_type),
+    values have to be json serializable so all stores behave the same.
+    Values are returned as stored, so always call set after changing one.
+
+    Sessions that were not used for session_ttl seconds are removed, and the
+    least recently used ones once there are more than max_sessions, so a
+    server that runs for a long time does not keep every upload. A removed
+    session can be resumed from its journal or snapshot.
+    """
+
+    def __init__(self, session_ttl=24 * 3600, max_sessions=100):
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        # least recently used session first
+        self._sessions = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield
+
+    def _session(self, session_id, create=False):
+        # call with the lock held
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return {}
+            self._evict(keep=1)
+            session = self._sessions[session_id] = {}
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        return session
+
+    def _evict(self, keep=0):
+        # remove expired sessions and make room for keep new ones
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if (
+                len(self._sessions) + keep <= self.max_sessions
+                and now - self._last_used[oldest] <= self.session_ttl
+            ):
+                break
+            self.clear(oldest)
+
+    def get(self, session_id, key, default=None):
+        with self._lock:
+            return self._session(session_id).get(tuple(key), default)
+
+    def set(self, session_id, key, value):
+        with self._lock:
+            self._session(session_id, create=True)[tuple(key)] = value
+
+    def items(self, session_id, prefix=()):
+        """
+        Return all (key, value) pairs of a session whose key starts with prefix.
+        """
+        prefix = tuple(prefix)
+        with self._lock:
+            session_items = list(self._session(session_id).items())
+        return [
+            (key, value) for key, value in session_items if key[: len(prefix)] == prefix
+        ]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+
+
+class SQLiteStateStore:
+    """
+    Same interface as MemoryStateStore but backed by a SQLite file, so the
+    state is shared between server processes and survives a restart.
+    """
+
+    def __init__(self, path="jogos_state.sqlite"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "session TEXT, key TEXT, value TEXT, PRIMARY KEY (session, key))"
+        )
+
+    @staticmethod
+    def _encode_key(key):
+        return json.dumps(list(key))
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def get(self, session_id, key, default=None):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM state WHERE session = ? AND key = ?",
+                (session_id, self._encode_key(key)),
+            ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, session_id, key, value):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO state VALUES (?, ?, ?) ON CONFLICT (session, key) "
+                "DO UPDATE SET value = excluded.value",
+                (session_id, self._encode_key(key), json.dumps(value)),
+            )
+
+    def items(self, session_id, prefix=()):
+        """
+        Return all (key, value) pairs of a session whose key starts with prefix.
+        """
+        # an encoded prefix without its closing bracket is a string prefix of
+        # all encoded keys that start with it
+        encoded_prefix = self._encode_key(prefix)[:-1]
+        if prefix:
+            encoded_prefix += ","
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value FROM state WHERE session = ? "
+                "AND substr(key, 1, ?) = ? ORDER BY rowid",
+                (session_id, len(encoded_prefix), encoded_prefix),
+            ).fetchall()
+        return [(tuple(json.loads(key)), json.loads(value)) for key, value in rows]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM state WHERE session = ?", (session_id,)
+            )
+
+
+_state_store = MemoryStateStore()
+
+
+def get_state_store():
+    return _state_store
+
+
+def set_state_store(state_store):
+    global _state_store
+    _state_store = state_store
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def register_filename(session_id, filename):
+    _state_store.set(session_id, ("filename",), filename)
+
+
+def get_filename(session_id):
+    return _state_store.get(session_id, ("filename",))
+
+
+# the session that writes the journal and the snapshot of every tournament
+# file, kept like a session of its own so all server processes see it
+_file_owners = "tournament-files"
+
+
+def get_file_owner(filename):
+    """
+    Return the live session that writes the journal and snapshot of a
+    tournament file or None.
+    """
+    session_id = _state_store.get(_file_owners, (filename,))
+    if session_id is not None and get_filename(session_id) == filename:
+        return session_id
+    return None
+
+
+def take_over_file(session_id):
+    """
+    Make a session the only one that writes the journal and snapshot of its
+    tournament file (the same file uploaded in a second browser). The session
+    that owned the file before is removed, its browser then shows the session
+    expired message. Returns True if there was such a session.
+    """
+    filename = get_filename(session_id)
+    with _state_store.transaction():
+        owner = get_file_owner(filename)
+        _state_store.set(_file_owners, (filename,), session_id)
+    if owner is None or owner == session_id:
+        return False
+    _state_store.clear(owner)
+    return True
+
+
+def find_duplicate_players(names):
+    """
+    Return the names that occur more than once, in the order they first occur.
+    """
+    seen, duplicates = set(), []
+    for name in names:
+        if name in seen and name not in duplicates:
+            duplicates.append(name)
+        seen.add(name)
+    return duplicates
+
+
+def register_category(session_id, category, category_table, scoring_rules):
+    """
+    Store the rows of a category together with its player registry and the
+    scoring rules of the category.
+
+    Every player gets the index of their row as integer id, the registry maps
+    apelido -> id so players are found without searching the rows. Two
+    players with the same apelido would share their points, so duplicates
+    are not allowed.
+    """
+    names = [row["Apelido"] for row in category_table]
+    duplicates = find_duplicate_players(names)
+    if duplicates:
+        raise ValueError(f"Duplicate apelidos in {category}: {duplicates}")
+    with _state_store.transaction():
+        _state_store.set(session_id, ("category", category), category_table)
+        _state_store.set(
+            session_id,
+            ("players", category),
+            {name: player_id for player_id, name in enumerate(names)},
+        )
+        _state_store.set(session_id, ("rules", category), scoring_rules.to_dict())
+
+
+def get_player_ids(session_id, category):
+    """
+    Return the player registry of a category as {apelido: id}.
+    """
+    return _state_store.get(session_id, ("players", category))
+
+
+def get_player_groups(session_id, category):
+    """
+    Return {apelido: [group values]} of the roster columns the scoring rules
+    of the category separate players by (see app_chaves).
+    """
+    columns = get_scoring_rules(session_id, category).separate_by
+    return {
+        row["Apelido"]: [row.get(column) for column in columns]
+        for row in _state_store.get(session_id, ("category", category))
+    }
+
+
+def get_scoring_rules(session_id, category):
+    return ScoringRules.from_dict(_state_store.get(session_id, ("rules", category)))
+
+
+def register_round(session_id, category, round, players, chaves, pairs, scores=None):
+    """
+    Store a newly created round together with its score array.
+
+    pairs maps chave -> game type -> [(player 1, player 2)], scores defaults
+    to an empty score array (see app_scoring).
+    """
+    if scores is None:
+        scores = new_round_scores(pairs, get_scoring_rules(session_id, category))
+    with _state_store.transaction():
+        _state_store.set(
+            session_id,
+            ("round", category, round),
+            {"players": players, "chaves": chaves, "pairs": pairs},
+        )
+        _state_store.set(session_id, ("scores", category, round), scores.tolist())
+
+
+def _get_scores(session_id, category, round, pairs, scoring_rules):
+    # stores only hold json, so the array is kept as nested lists
+    return np.array(
+        _state_store.get(session_id, ("scores", category, round)), dtype=np.int64
+    ).reshape(new_round_scores(pairs, scoring_rules).shape)
+
+
+def store_chave_table(session_id, table_id, table_rows):
+    """
+    Save the points of an edited chave table.
+
+    Returns the previous and the new rows of the table as they are stored.
+    """
+    category, round = table_id["index"], table_id["round"]
+    chave, game_type = table_id["chave"], table_id["game_type"]
+    scoring_rules = get_scoring_rules(session_id, category)
+    with _state_store.transaction():
+        pairs = get_round(session_id, category, round)["pairs"]
+        scores = _get_scores(session_id, category, round, pairs, scoring_rules)
+        old_table_rows = get_table_rows(scores, pairs, chave, game_type, scoring_rules)
+        set_table_rows(scores, pairs, chave, game_type, table_rows, scoring_rules)
+        _state_store.set(session_id, ("scores", category, round), scores.tolist())
+    return old_table_rows, get_table_rows(
+        scores, pairs, chave, game_type, scoring_rules
+    )
+
+
+def get_rounds(session_id, category):
+    return sorted(
+        key[2] for key, _ in _state_store.items(session_id, ("round", category))
+    )
+
+
+def get_round(session_id, category, round):
+    return _state_store.get(session_id, ("round", category, round))
+
+
+def get_round_scores(session_id, category, round):
+    """
+    Return the round info (players, chaves, pairs) and the score array of a
+    round.
+    """
+    round_info = get_round(session_id, category, round)
+    return round_info, _get_scores(
+        session_id,
+        category,
+        round,
+        round_info["pairs"],
+        get_scoring_rules(session_id, category),
+    )
+
+
+def get_category_chaves(session_id, category):
+    """
+    Return the chaves (lists of players) of all rounds of a category.
+    """
+    return [
+        chave
+        for round in get_rounds(session_id, category)
+        for chave in get_round(session_id, category, round)["chaves"].values()
+    ]
+
+
+def get_round_tables(session_id, category, round):
+    """
+    Return the rows of all chave tables of a round as chave -> game type -> rows.
+    """
+    round_info, scores = get_round_scores(session_id, category, round)
+    pairs = round_info["pairs"]
+    scoring_rules = get_scoring_rules(session_id, category)
+    return {
+        chave: {
+            game_type: get_table_rows(scores, pairs, chave, game_type, scoring_rules)
+            for game_type in chave_pairs
+        }
+        for chave, chave_pairs in pairs.items()
+    }
+
+
+def _round_player_points(session_id, category, round):
+    # {player: (personal, game, total, games)} of all players of a round
+    round_info, scores = get_round_scores(session_id, category, round)
+    players = round_info["players"]
+    scoring_rules = get_scoring_rules(session_id, category)
+    player_index = round_player_index(round_info["pairs"], players)
+    personal, game = sum_player_points(
+        scores, player_index, len(players), scoring_rules
+    )
+    personal, game, total = weight_points(personal, game, scoring_rules)
+    games = games_played(player_index, len(players))
+    return {
+        name: player_points
+        for name, *player_points in zip(
+            players, personal.tolist(), game.tolist(), total.tolist(), games.tolist()
+        )
+        if name != "Placeholder"
+    }
+
+
+def get_round_table(session_id, category, round):
+    """
+    Return the rows of the round table with the current points of every player.
+    Players are ranked by the points per game (see rank_players).
+    """
+    player_points = _round_player_points(session_id, category, round)
+    return [
+        {
+            "Player": name,
+            "personal points": personal,
+            "game points": game,
+            "total points": total,
+            "games": games,
+            "points per game": per_game(total, games),
+        }
+        for name, (personal, game, total, games) in sorted(player_points.items())
+    ]
+
+
+def get_round_ranking(session_id, category, round):
+    """
+    Return the ranking of the players of a round (see rank_players) as
+    {"order": [players, best first], "ranks": {player: rank},
+    "ties": [{"rank": rank, "players": [players]}]}.
+    """
+    round_info, scores = get_round_scores(session_id, category, round)
+    # sorted names, so players that are tied in every key are ordered by name
+    names = sorted(name for name in round_info["players"] if name != "Placeholder")
+    order, ranks, ties = rank_players(
+        scores,
+        round_player_index(round_info["pairs"], names),
+        len(names),
+        get_scoring_rules(session_id, category),
+    )
+    return {
+        "order": [names[i] for i in order],
+        "ranks": dict(zip(names, ranks.tolist())),
+        "ties": [
+            {"rank": rank, "players": [names[i] for i in players]}
+            for rank, players in ties
+        ],
+    }
+
+
+def get_round_contributions(session_id, category, round):
+    """
+    Return the raw points and games of every chave table of a round as
+    {chave: {game_type: {player: [personal, game, games]}}}.
+    """
+    round_info, scores = get_round_scores(session_id, category, round)
+    return table_contributions(
+        scores, round_info["pairs"], get_scoring_rules(session_id, category)
+    )
+
+
+def get_category_round_totals(session_id, category):
+    """
+    Return the total points of every player in every round of a category as
+    {round: {player: total}}. Rounds are strings so the dict can be sent to
+    the browser as is.
+    """
+    return {
+        str(round): {
+            name: total
+            for name, (_, _, total, _) in _round_player_points(
+                session_id, category, round
+            ).items()
+        }
+        for round in get_rounds(session_id, category)
+    }
+
+
+def get_category_table(session_id, category):
+    """
+    Return the rows of the category table with the points of all rounds.
+    """
+    category_points = {}
+    for round in get_rounds(session_id, category):
+        for name, (_, _, total, _) in _round_player_points(
+            session_id, category, round
+        ).items():
+            category_points[name] = category_points.get(name, 0) + total
+
+    category_table = [
+        dict(row) for row in _state_store.get(session_id, ("category", category))
+    ]
+    player_ids = get_player_ids(session_id, category)
+    for name, points in category_points.items():
+        # names outside the category (e.g. from an older file) have no id
+        if name in player_ids:
+            category_table[player_ids[name]]["Points"] = points
+    return category_table
+
+
+def get_category_scores(session_id, category):
+    """
+    Return (round, round info, score array) for all rounds of a category.
+    """
+    return [
+        (round, *get_round_scores(session_id, category, round))
+        for round in get_rounds(session_id, category)
+    ]
+
+
+def get_chave_tables(session_id, category=None):
+    """
+    Return the ids and rows of all chave tables, optionally only for one
+    category. The ids look like the ids of the chave-table components.
+    """
+    prefix = ("round",) if category is None else ("round", category)
+    all_table_ids, all_tables = [], []
+    for key, _ in _state_store.items(session_id, prefix):
+        _, table_category, round = key
+        for chave, game_type_tables in get_round_tables(
+            session_id, table_category, round
+        ).items():
+            for game_type, table_rows in game_type_tables.items():
+                all_table_ids.append(
+                    {
+                        "type": "chave-table",
+                        "index": table_category,
+                        "round": round,
+                        "chave": chave,
+                        "game_type": game_type,
+                    }
+                )
+                all_tables.append(table_rows)
+    return all_table_ids, all_tables
@@ -0,0 +1,177 @@
+// The round and category points are summed up in the browser, so entering
+// points does not need a round trip to the server. The server only stores
+// the chave tables and checks for ties (see save_chave_table in
+// app_logic.py).
+
+(function () {
+    // same as parse_points in app_scoring.py: "3+4+5" is summed up, empty
+    // cells and anything else that is not a sum of whole numbers (of up to 6
+    // digits) count as 0. The server writes the parsed points back into the
+    // table.
+    const maxCellPoints = 999999;
+    const pointsExpression = /^\s*[+-]?\s*[0-9]{1,6}(\s*[+-]\s*[0-9]{1,6})*\s*$/;
+    function cellPoints(value) {
+        if (typeof value === "number") {
+            if (!Number.isFinite(value) || Math.abs(value) > maxCellPoints) {
+                return 0;
+            }
+            return Math.trunc(value);
+        }
+        if (typeof value !== "string" || !pointsExpression.test(value)) {
+            return 0;
+        }
+        let points = 0;
+        for (const [, sign, number] of value.matchAll(/([+-]?)\s*([0-9]+)/g)) {
+            points += (sign === "-" ? -1 : 1) * parseInt(number, 10);
+        }
+        return points;
+    }
+
+    // same as table_contributions in app_scoring.py: {player: [personal
+    // points, unweighted game points, games]}. columns maps every score
+    // column to [score type (P1, P2, GP), referee weight].
+    function tableContribution(tableRows, columns) {
+        const contribution = {};
+        function add(player, personal, game) {
+            const playerPoints = contribution[player] || [0, 0, 0];
+            playerPoints[0] += personal;
+            playerPoints[1] += game;
+            playerPoints[2] += 1;
+            contribution[player] = playerPoints;
+        }
+        tableRows.forEach(function (row) {
+            const sums = [0, 0, 0];
+            Object.keys(columns).forEach(function (column) {
+                const [scoreType, weight] = columns[column];
+                sums[scoreType] += weight * cellPoints(row[column]);
+            });
+            add(row["Player 1"], sums[0], sums[2]);
+            add(row["Player 2"], sums[1], sums[2]);
+        });
+        return contribution;
+    }
+
+    function updateRoundTable(allTableData, allTableIds, contributions, roundTable) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!roundTable) {
+            return noUpdate;
+        }
+
+        // the stored contributions cover tables that are not rendered yet,
+        // the rendered tables always hold the current points
+        const tables = {};
+        Object.keys(contributions.tables).forEach(function (chave) {
+            tables[chave] = Object.assign({}, contributions.tables[chave]);
+        });
+        allTableIds.forEach(function (tableId, i) {
+            tables[tableId.chave] = tables[tableId.chave] || {};
+            tables[tableId.chave][tableId.game_type] = tableContribution(
+                allTableData[i] || [],
+                contributions.columns
+            );
+        });
+
+        const totals = {};
+        Object.values(tables).forEach(function (gameTypeTables) {
+            Object.values(gameTypeTables).forEach(function (contribution) {
+                Object.keys(contribution).forEach(function (player) {
+                    const playerTotals = totals[player] || [0, 0, 0];
+                    playerTotals[0] += contribution[player][0];
+                    playerTotals[1] += contribution[player][1];
+                    playerTotals[2] += contribution[player][2];
+                    totals[player] = playerTotals;
+                });
+            });
+        });
+
+        const newRoundTable = roundTable.map(function (row) {
+            const playerTotals = totals[row.Player] || [0, 0, 0];
+            const gamePoints = playerTotals[1] * contributions.game_point_factor;
+            const totalPoints = playerTotals[0] + gamePoints;
+            // players are ranked by the points per game, see rank_players
+            return Object.assign({}, row, {
+                "personal points": playerTotals[0],
+                "game points": gamePoints,
+                "total points": totalPoints,
+                "games": playerTotals[2],
+                "points per game": totalPoints / Math.max(playerTotals[2], 1),
+            });
+        });
+        if (JSON.stringify(newRoundTable) === JSON.stringify(roundTable)) {
+            return noUpdate;
+        }
+        return newRoundTable;
+    }
+
+    function updateCategoryTable(allRoundTables, allRoundTableIds, roundTotals, categoryTable) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!categoryTable) {
+            return noUpdate;
+        }
+
+        // rounds that are not rendered keep the points they were created with
+        const totals = Object.assign({}, roundTotals);
+        allRoundTableIds.forEach(function (roundTableId, i) {
+            const roundPoints = {};
+            (allRoundTables[i] || []).forEach(function (row) {
+                roundPoints[row.Player] = row["total points"];
+            });
+            totals[String(roundTableId.round)] = roundPoints;
+        });
+
+        const categoryPoints = {};
+        Object.keys(totals)
+            .sort(function (a, b) {
+                return Number(a) - Number(b);
+            })
+            .forEach(function (round) {
+                Object.keys(totals[round]).forEach(function (player) {
+                    categoryPoints[player] =
+                        (categoryPoints[player] || 0) + totals[round][player];
+                });
+            });
+
+        const newCategoryTable = categoryTable.map(function (row) {
+            if (!(row.Apelido in categoryPoints)) {
+                return row;
+            }
+            return Object.assign({}, row, { Points: categoryPoints[row.Apelido] });
+        });
+        if (JSON.stringify(newCategoryTable) === JSON.stringify(categoryTable)) {
+            return noUpdate;
+        }
+        return newCategoryTable;
+    }
+
+    // chosen are the checked tiebreaker options, openSpots how many of the
+    // tied players advance (0 without a tie), see _find_ties_in_round
+    function enableNextRoundButton(chosen, nClicksNewRound, openSpots) {
+        chosen = chosen || [];
+        if (nClicksNewRound !== null && nClicksNewRound !== undefined && nClicksNewRound > 0) {
+            return [true, "new Round already started"];
+        } else if (!openSpots && !chosen.includes("No tiebreaker needed")) {
+            return [true, "Check the tiebreaker box before starting a new round"];
+        } else if (openSpots && chosen.length !== openSpots) {
+            return [true, "Please choose " + openSpots + " of the tied players"];
+        }
+        return [false, ""];
+    }
+
+    function limitTiebreaker(chosen, openSpots, options) {
+        chosen = chosen || [];
+        const full = openSpots > 0 && chosen.length >= openSpots;
+        return (options || []).map(function (option) {
+            const value = typeof option === "object" ? option.value : option;
+            return { label: value, value: value, disabled: full && !chosen.includes(value) };
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        jogos: {
+            update_round_table: updateRoundTable,
+            update_category_table: updateCategoryTable,
+            enable_next_round_button: enableNextRoundButton,
+            limit_tiebreaker: limitTiebreaker,
+        },
+    });
+})();
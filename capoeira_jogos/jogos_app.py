@@ -1,24 +1,71 @@
-from dash import dcc, html, Dash, dash_table, Input, Output, State, MATCH, ALL
+from dash import (
+    dcc,
+    html,
+    Dash,
+    dash_table,
+    Input,
+    Output,
+    State,
+    MATCH,
+    ALL,
+    ClientsideFunction,
+)
 from dash.dash_table.Format import Format, Scheme, Sign, Symbol
 import dash_bootstrap_components as dbc
 
 from app_layout import create_basic_layout
+from app_state import MemoryStateStore, set_state_store
+from app_cache import UploadCache, set_upload_cache
+from app_scoring import set_scoring_rules
+from app_backup import BackgroundWriter, set_autosaver
 from app_logic import (
     load_jogos_config_table,
-    collect_and_update_round_points,
-    collect_and_update_cat_points,
+    save_chave_table,
     check_ties_in_round,
-    enable_next_round_button,
     start_new_round,
+    render_round_tab,
+    render_game_type,
+    show_roda_schedule,
     generate_category_results,
-    save_everything_to_excl,
+    export_results,
 )
+from app_snapshot import save_snapshot
 
 
 class Jogos_App:
-    def __init__(self):
+    def __init__(
+        self,
+        state_store=None,
+        autosave_interval=2.0,
+        scoring_rules=None,
+        category_scoring_rules=None,
+        upload_cache=None,
+    ):
         print()
 
+        # every category is scored with scoring_rules (a ScoringRules, by
+        # default 3 referees and game points * 0.9) unless it has its own rules
+        # in category_scoring_rules ({category: ScoringRules})
+        set_scoring_rules(scoring_rules, category_scoring_rules)
+
+        # the tournament state is kept on the server, the browser only sends ids
+        # and the edited chave table. Pass a SQLiteStateStore to share the state
+        # between several server processes.
+        if state_store is None:
+            state_store = MemoryStateStore()
+        set_state_store(state_store)
+
+        # repeated uploads of the same file are served from an on disk cache
+        # (by default jogos_cache/, at most 64 MB), NoUploadCache switches it off
+        if upload_cache is None:
+            upload_cache = UploadCache()
+        set_upload_cache(upload_cache)
+
+        # the tournament snapshot (Tournament_<file>.sqlite) is written in the
+        # background at most every autosave_interval seconds instead of after
+        # every single edit, excel is only written on export
+        set_autosaver(BackgroundWriter(save_snapshot, autosave_interval))
+
         external_stylesheets = [dbc.themes.BOOTSTRAP]
         self.app = Dash(
             __name__,
@@ -27,9 +74,6 @@ class Jogos_App:
         )
         self.app.title = "capoeira jogos"
 
-        self.scale_game_points = 0.9
-        self.chave_size = 4
-
         self.app.layout = create_basic_layout()
 
         # add callbacks
@@ -38,54 +82,81 @@ class Jogos_App:
         self.app.callback(
             Output("output-data-upload", "children"),
             Output("upload-data", "children"),
+            Output("session-id", "data"),
             Input("upload-data", "contents"),
             State("upload-data", "filename"),
             State("upload-data", "children"),
+            State("session-id", "data"),
+            State("resume-journal", "value"),
             prevent_initial_call=True,
         )(load_jogos_config_table)
 
+        # an edit of a chave table is a single request: save_chave_table stores
+        # the table and sets the tiebreaker options of the round
         self.app.callback(
-            # Output({"type": "category-table", "index": MATCH}, "data"),
-            Output({"type": "round_table", "round": MATCH, "index": MATCH}, "data"),
-            Output(
+            Input(
                 {
-                    "type": "round_tie_breaker",
-                    "round": MATCH,
+                    "type": "chave-table",
                     "index": MATCH,
+                    "round": MATCH,
+                    "chave": MATCH,
+                    "game_type": MATCH,
                 },
-                "value",
+                "data",
             ),
-            Input(
+            State(
                 {
                     "type": "chave-table",
                     "index": MATCH,
                     "round": MATCH,
-                    "chave": ALL,
-                    "game_type": ALL,
+                    "chave": MATCH,
+                    "game_type": MATCH,
                 },
+                "id",
+            ),
+            State(
+                {"type": "advance-dropdown", "round": MATCH, "index": MATCH}, "value"
+            ),
+            State("session-id", "data"),
+            prevent_initial_call=True,
+        )(save_chave_table)
+
+        # round and category points are summed up in the browser, see
+        # assets/round_points.js
+        chave_tables_of_round = {
+            "type": "chave-table",
+            "index": MATCH,
+            "round": MATCH,
+            "chave": ALL,
+            "game_type": ALL,
+        }
+        self.app.clientside_callback(
+            ClientsideFunction(namespace="jogos", function_name="update_round_table"),
+            Output({"type": "round_table", "round": MATCH, "index": MATCH}, "data"),
+            Input(chave_tables_of_round, "data"),
+            State(chave_tables_of_round, "id"),
+            State(
+                {"type": "round-contributions", "round": MATCH, "index": MATCH},
                 "data",
             ),
             State({"type": "round_table", "round": MATCH, "index": MATCH}, "data"),
             prevent_initial_call=True,
-        )(collect_and_update_round_points)
+        )
 
-        self.app.callback(
+        self.app.clientside_callback(
+            ClientsideFunction(
+                namespace="jogos", function_name="update_category_table"
+            ),
             Output({"type": "category-table", "index": MATCH}, "data"),
             Input({"type": "round_table", "round": ALL, "index": MATCH}, "data"),
+            State({"type": "round_table", "round": ALL, "index": MATCH}, "id"),
+            State({"type": "category-round-totals", "index": MATCH}, "data"),
             State({"type": "category-table", "index": MATCH}, "data"),
             prevent_initial_call=True,
-        )(collect_and_update_cat_points)
+        )
 
+        # sets the tiebreaker options and the open spots of the round
         self.app.callback(
-            Output(
-                {
-                    "type": "round_tie_breaker",
-                    "round": MATCH,
-                    "index": MATCH,
-                },
-                "options",
-            ),
-            Input({"type": "round_table", "round": MATCH, "index": MATCH}, "data"),
             Input(
                 {
                     "type": "advance-dropdown",
@@ -94,10 +165,14 @@ class Jogos_App:
                 },
                 "value",
             ),
+            State("session-id", "data"),
             prevent_initial_call=True,
         )(check_ties_in_round)
 
-        self.app.callback(
+        self.app.clientside_callback(
+            ClientsideFunction(
+                namespace="jogos", function_name="enable_next_round_button"
+            ),
             Output(
                 {
                     "type": "add-round-button",
@@ -120,18 +195,38 @@ class Jogos_App:
             Input(
                 {"type": "add-round-button", "round": MATCH, "index": MATCH}, "n_clicks"
             ),
+            Input({"type": "round-open-spots", "round": MATCH, "index": MATCH}, "data"),
+            prevent_initial_call=True,
+        )
+
+        # no more tied players than open spots can be chosen
+        self.app.clientside_callback(
+            ClientsideFunction(namespace="jogos", function_name="limit_tiebreaker"),
+            Output(
+                {"type": "round_tie_breaker", "round": MATCH, "index": MATCH},
+                "options",
+                allow_duplicate=True,
+            ),
+            Input(
+                {"type": "round_tie_breaker", "round": MATCH, "index": MATCH}, "value"
+            ),
+            Input({"type": "round-open-spots", "round": MATCH, "index": MATCH}, "data"),
+            State(
+                {"type": "round_tie_breaker", "round": MATCH, "index": MATCH},
+                "options",
+            ),
             prevent_initial_call=True,
-        )(enable_next_round_button)
+        )
 
         self.app.callback(
             Output(
                 {"type": "cat-round-tabs", "index": MATCH},
                 "children",
             ),
+            Output({"type": "rendered-rounds", "index": MATCH}, "data"),
             Input(
                 {"type": "add-round-button", "round": ALL, "index": MATCH}, "n_clicks"
             ),
-            State({"type": "round_table", "round": ALL, "index": MATCH}, "data"),
             State(
                 {
                     "type": "advance-dropdown",
@@ -148,70 +243,75 @@ class Jogos_App:
                 },
                 "value",
             ),
-            State(
-                {"type": "cat-round-tabs", "index": MATCH},
-                "children",
-            ),
             State(
                 {"type": "cat-round-tabs", "index": MATCH},
                 "id",
             ),
+            State("session-id", "data"),
             prevent_initial_call=True,
         )(start_new_round)
 
+        # round tabs and game types are only rendered once they are opened
         self.app.callback(
-            Output({"type": "offcanvas_results", "index": MATCH}, "is_open"),
-            Output({"type": "offcanvas_results", "index": MATCH}, "children"),
-            Input({"type": "show-results-button", "index": MATCH}, "n_clicks"),
-            State(
-                {
-                    "type": "chave-table",
-                    "index": MATCH,
-                    "round": ALL,
-                    "chave": ALL,
-                    "game_type": ALL,
-                },
-                "data",
+            Output(
+                {"type": "cat-round-tabs", "index": MATCH},
+                "children",
+                allow_duplicate=True,
             ),
-            State({"type": "round_table", "round": ALL, "index": MATCH}, "data"),
-            State(
-                {
-                    "type": "chave-table",
-                    "index": MATCH,
-                    "round": ALL,
-                    "chave": ALL,
-                    "game_type": ALL,
-                },
-                "id",
+            Output(
+                {"type": "rendered-rounds", "index": MATCH},
+                "data",
+                allow_duplicate=True,
             ),
+            Input({"type": "cat-round-tabs", "index": MATCH}, "value"),
+            State({"type": "rendered-rounds", "index": MATCH}, "data"),
+            State("session-id", "data"),
             prevent_initial_call=True,
-        )(generate_category_results)
+        )(render_round_tab)
 
         self.app.callback(
-            Output("div-hidden", "children"),
-            Input(
-                {
-                    "type": "chave-table",
-                    "index": ALL,
-                    "round": ALL,
-                    "chave": ALL,
-                    "game_type": ALL,
-                },
+            Output(
+                {"type": "shave-tabs", "category": MATCH, "round": MATCH}, "children"
+            ),
+            Output(
+                {"type": "rendered-game-types", "category": MATCH, "round": MATCH},
                 "data",
             ),
+            Input(
+                {"type": "shave-tabs", "category": MATCH, "round": MATCH},
+                "active_item",
+            ),
             State(
-                {
-                    "type": "chave-table",
-                    "index": ALL,
-                    "round": ALL,
-                    "chave": ALL,
-                    "game_type": ALL,
-                },
-                "id",
+                {"type": "rendered-game-types", "category": MATCH, "round": MATCH},
+                "data",
             ),
-            State("upload-data", "filename"),
+            State("session-id", "data"),
+            prevent_initial_call=True,
+        )(render_game_type)
+
+        self.app.callback(
+            Output(
+                {"type": "roda-schedule", "round": MATCH, "index": MATCH}, "children"
+            ),
+            Input({"type": "roda-count", "round": MATCH, "index": MATCH}, "value"),
+            State("session-id", "data"),
+            prevent_initial_call=True,
+        )(show_roda_schedule)
+
+        self.app.callback(
+            Output({"type": "offcanvas_results", "index": MATCH}, "is_open"),
+            Output({"type": "offcanvas_results", "index": MATCH}, "children"),
+            Input({"type": "show-results-button", "index": MATCH}, "n_clicks"),
+            State("session-id", "data"),
+            prevent_initial_call=True,
+        )(generate_category_results)
+
+        self.app.callback(
+            Output("download-results", "data"),
+            Input("export-results-button", "n_clicks"),
+            State("session-id", "data"),
             prevent_initial_call=True,
-        )(save_everything_to_excl)
+        )(export_results)
 
     def run_server(self):
         self.app.run_server(debug=True, use_reloader=True, port=8084)
@@ -8,7 +8,7 @@ a = Analysis(
     ['jogos_manager.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[("assets", "capoeira_jogos/assets")],
     hiddenimports=["threading","waitress","webbrowser","capoeira_jogos"],
     hookspath=[],
     hooksconfig={},
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+repository = os.path.dirname(os.path.dirname(__file__))
+# the app modules import each other as scripts, like jogos_manager.py does
+sys.path.insert(0, os.path.join(repository, "capoeira_jogos"))
+
+from app_backup import get_autosaver  # noqa: E402
+from app_cache import NoUploadCache  # noqa: E402
+from app_state import get_state_store  # noqa: E402
+from dash_client import DashClient  # noqa: E402
+from jogos_app import Jogos_App  # noqa: E402
+
+
+@pytest.fixture
+def example_file():
+    return os.path.join(repository, "examples", "example_excel_file.xlsx")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, example_file):
+    # snapshots and journals are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    client = DashClient(Jogos_App(upload_cache=NoUploadCache()).app)
+    client.upload(example_file)
+    yield client
+    # write the snapshot here, the autosaver would write it after the test
+    # into the working directory of the next one
+    get_autosaver().flush()
+    get_state_store().clear(client.get("session-id", "data"))
@@ -0,0 +1,215 @@
+"""
+A scripted browser for the tests: keeps the props of all components with an
+id and fires the callbacks like the dash renderer does, through
+/_dash-update-component of the flask test client.
+
+Clientside callbacks are not run, all of their outputs count as changed so
+every server callback that could follow them is fired.
+"""
+
+import base64
+import json
+
+from dash._utils import to_json
+
+
+def _components(tree, found):
+    # all components with props in a layout (or a part of it) as json
+    if isinstance(tree, dict):
+        if "props" in tree:
+            found.append(tree)
+        for value in tree.get("props", tree).values():
+            _components(value, found)
+    elif isinstance(tree, list):
+        for value in tree:
+            _components(value, found)
+    return found
+
+
+def _key(component_id):
+    return json.dumps(component_id, sort_keys=True)
+
+
+def _parse_id(text):
+    # ids of callback dependencies and responses, pattern ids are json
+    return json.loads(text) if text.startswith("{") else text
+
+
+class DashClient:
+    def __init__(self, app):
+        self.app = app
+        self.client = app.server.test_client()
+        self.props = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.clientside = {
+            item["output"]
+            for item in app._callback_list
+            if item.get("clientside_function")
+        }
+        self._add_components(json.loads(to_json(app.layout)))
+
+    def _add_components(self, tree):
+        for component in _components(tree, []):
+            component_id = component["props"].get("id")
+            if component_id is not None:
+                self.props[_key(component_id)] = component["props"]
+
+    def get(self, component_id, prop):
+        return self.props[_key(component_id)].get(prop)
+
+    def find(self, type_, **id_values):
+        """
+        Return the ids of all components of a pattern matching type.
+        """
+        found = []
+        for key in self.props:
+            component_id = json.loads(key)
+            if (
+                isinstance(component_id, dict)
+                and component_id.get("type") == type_
+                and all(component_id.get(k) == v for k, v in id_values.items())
+            ):
+                found.append(component_id)
+        return found
+
+    def _matches(self, pattern, component_id, match_values):
+        if not isinstance(pattern, dict) or not isinstance(component_id, dict):
+            return pattern == component_id
+        if set(pattern) != set(component_id):
+            return False
+        for name, value in pattern.items():
+            if value == ["MATCH"]:
+                if match_values.get(name, component_id[name]) != component_id[name]:
+                    return False
+            elif value not in (["ALL"], ["ALLSMALLER"]) and value != component_id[name]:
+                return False
+        return True
+
+    def _resolve(self, dependency, match_values, with_value=True):
+        pattern = _parse_id(dependency["id"])
+        found = [
+            {"id": json.loads(key), "property": dependency["property"]}
+            for key in self.props
+            if self._matches(pattern, json.loads(key), match_values)
+        ]
+        if with_value:
+            for item in found:
+                item["value"] = self.get(item["id"], item["property"])
+        if isinstance(pattern, dict) and ["ALL"] in pattern.values():
+            return found
+        return found[0] if found else None
+
+    def upload(self, *paths, resume=False):
+        contents = [
+            "data:application/vnd.openxmlformats;base64,"
+            + base64.b64encode(open(path, "rb").read()).decode()
+            for path in paths
+        ]
+        self.props[_key("upload-data")]["filename"] = [
+            path.replace("\\", "/").split("/")[-1] for path in paths
+        ]
+        self.props[_key("resume-journal")]["value"] = resume
+        self.fire("upload-data", "contents", contents)
+
+    def fire(self, component_id, prop, value):
+        """
+        Set a prop like the user does and run all callbacks that follow.
+        """
+        self.props[_key(component_id)][prop] = value
+        queue = [(component_id, prop)]
+        while queue:
+            changed_id, changed_prop = queue.pop(0)
+            for callback_id, callback in self.app.callback_map.items():
+                for dependency in callback["inputs"]:
+                    pattern = _parse_id(dependency["id"])
+                    if dependency["property"] != changed_prop or not self._matches(
+                        pattern, changed_id, {}
+                    ):
+                        continue
+                    match_values = {
+                        name: changed_id[name]
+                        for name, value in (
+                            pattern.items() if isinstance(pattern, dict) else ()
+                        )
+                        if value == ["MATCH"]
+                    }
+                    queue.extend(
+                        self._call(
+                            callback_id,
+                            callback,
+                            changed_id,
+                            changed_prop,
+                            match_values,
+                        )
+                    )
+
+    def _call(self, callback_id, callback, changed_id, changed_prop, match_values):
+        outputs = callback["output"]
+        output_list = outputs if isinstance(outputs, list) else [outputs]
+        output_list = [
+            self._resolve(
+                {
+                    "id": output.component_id_str(),
+                    "property": output.component_property.split("@")[0],
+                },
+                match_values,
+                with_value=False,
+            )
+            for output in output_list
+        ]
+        if None in output_list:
+            # the renderer does not fire callbacks with missing outputs
+            return []
+        if callback_id in self.clientside:
+            return [
+                (item["id"], item["property"])
+                for output in output_list
+                for item in (output if isinstance(output, list) else [output])
+            ]
+
+        body = to_json(
+            {
+                "output": callback_id,
+                "outputs": output_list if isinstance(outputs, list) else output_list[0],
+                "inputs": [
+                    self._resolve(dependency, match_values)
+                    for dependency in callback["inputs"]
+                ],
+                "state": [
+                    self._resolve(dependency, match_values)
+                    for dependency in callback["state"]
+                ],
+                "changedPropIds": [
+                    (
+                        json.dumps(changed_id, sort_keys=True, separators=(",", ":"))
+                        if isinstance(changed_id, dict)
+                        else changed_id
+                    )
+                    + "."
+                    + changed_prop
+                ],
+            }
+        )
+        self.requests += 1
+        self.bytes_sent += len(body)
+        response = self.client.post(
+            "/_dash-update-component", data=body, content_type="application/json"
+        )
+        if response.status_code == 204:
+            return []
+        assert response.status_code == 200, response.data.decode()[-2000:]
+        self.bytes_received += len(response.data)
+
+        changed = []
+        response = json.loads(response.data)
+        for updates in (response["response"], response.get("sideUpdate") or {}):
+            for text_id, props in updates.items():
+                component_id = _parse_id(text_id)
+                for prop, value in props.items():
+                    self.props.setdefault(_key(component_id), {})[prop] = value
+                    if prop == "children":
+                        self._add_components(value)
+                    changed.append((component_id, prop))
+        return changed
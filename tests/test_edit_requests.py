@@ -0,0 +1,101 @@
+"""
+Counts the server requests of a chave table edit, see save_chave_table.
+"""
+
+import json
+import os
+
+import pytest
+
+from app_backup import get_autosaver
+from app_journal import journal_path, read_journal
+from app_snapshot import save_snapshot, snapshot_path
+from app_state import get_state_store, new_session_id, register_filename
+from dash_client import DashClient
+
+
+def _edit(client, table_id, value):
+    data = [dict(row) for row in client.get(table_id, "data")]
+    column = next(column for column in data[0] if column.startswith("Ref"))
+    data[0][column] = value
+    requests = client.requests
+    client.fire(table_id, "data", data)
+    return client.requests - requests
+
+
+def test_upload(client):
+    assert client.find("category-tab")
+    assert client.find("chave-table")
+
+
+@pytest.mark.parametrize("value", ["3", "7", "0"])
+def test_edit_is_one_request(client, value):
+    table_id = client.find("chave-table")[0]
+    assert _edit(client, table_id, value) == 1
+    assert not client.get("session-expired", "is_open")
+
+
+def test_every_game_type_is_one_request(client):
+    for tabs_id in client.find("shave-tabs"):
+        for game_type in ["Sao Bento", "Benguela", "Iuna", "Angola"]:
+            client.fire(tabs_id, "active_item", game_type)
+    table_ids = client.find("chave-table")
+    assert len(table_ids) > 4
+    assert [_edit(client, table_id, "5") for table_id in table_ids] == [1] * len(
+        table_ids
+    )
+
+
+def test_expired_session(client, example_file):
+    # like a restart of the server, the browser keeps its session id
+    get_state_store().clear(client.get("session-id", "data"))
+    table_id = client.find("chave-table")[0]
+    assert _edit(client, table_id, "3") == 1
+    assert client.get("session-expired", "is_open")
+
+    client.upload(example_file)
+    assert not client.get("session-expired", "is_open")
+
+
+def test_edit_without_advancing_players(client):
+    table_id = client.find("chave-table")[0]
+    round_id = {"index": table_id["index"], "round": table_id["round"]}
+    client.fire({"type": "advance-dropdown", **round_id}, "value", None)
+    assert _edit(client, table_id, "3") == 1
+    assert client.get({"type": "round_tie_breaker", **round_id}, "options") == []
+
+
+def test_same_file_in_second_browser(client, example_file):
+    # e.g. a second laptop, it takes over the journal and snapshot of the file
+    second_client = DashClient(client.app)
+    second_client.upload(example_file)
+    assert "another browser" in json.dumps(second_client.get("upload-data", "children"))
+
+    table_id = client.find("chave-table")[0]
+    _edit(client, table_id, "3")
+    assert client.get("session-expired", "is_open")
+    assert _edit(second_client, table_id, "4") == 1
+    assert not second_client.get("session-expired", "is_open")
+
+    # only the second browser wrote to the journal
+    scores = [
+        entry[-1]
+        for entry in read_journal(journal_path("example_excel_file.xlsx"))
+        if entry[0] == "score"
+    ]
+    assert scores == [4]
+
+
+def test_snapshot_only_written_by_owner(client):
+    get_autosaver().flush()
+    os.remove(snapshot_path("example_excel_file.xlsx"))
+    # a session of the same file that does not own it (e.g. its autosave was
+    # still pending when the file was taken over)
+    other_session = new_session_id()
+    register_filename(other_session, "example_excel_file.xlsx")
+    save_snapshot(other_session)
+    assert not os.path.exists(snapshot_path("example_excel_file.xlsx"))
+
+    save_snapshot(client.get("session-id", "data"))
+    assert os.path.exists(snapshot_path("example_excel_file.xlsx"))
+    get_state_store().clear(other_session)
@@ -0,0 +1,16 @@
+from app_schedule import max_rodas, schedule_round
+
+pairs = {
+    "Chave 1": {
+        "Sao Bento": [("A", "B"), ("C", "D")],
+        "Angola": [("A", "C"), ("B", "D")],
+    }
+}
+
+
+def test_rodas_are_limited_to_the_games():
+    assert max_rodas(pairs) == 4
+    schedule, total_minutes = schedule_round(pairs, 10**9, 3)
+    assert len(schedule) == 4
+    assert {game["roda"] for game in schedule} <= set(range(1, max_rodas(pairs) + 1))
+    assert (schedule, total_minutes) == schedule_round(pairs, 4, 3)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from app_scoring import ScoringRules, cell_points, new_round_scores, set_table_rows
+
+
+@pytest.mark.parametrize(
+    "value, points",
+    [
+        ("3+4+5", 12),
+        (" -2 + 3 ", 1),
+        ("", 0),
+        (None, 0),
+        ("3+", 0),
+        ("999999", 999999),
+        # typos that do not fit the score array
+        ("99999999999999999999", 0),
+        (1e30, 0),
+        (float("nan"), 0),
+        # only ascii digits, like in the browser
+        ("٣", 0),
+        ("１", 0),
+        (7.9, 7),
+    ],
+)
+def test_cell_points(value, points):
+    assert cell_points(value) == points
+
+
+def test_set_table_rows_with_long_number():
+    scoring_rules = ScoringRules()
+    pairs = {"Chave 0": {"Sao Bento": [("a", "b")]}}
+    scores = new_round_scores(pairs, scoring_rules)
+    row = {column: "2" for column in scoring_rules.score_columns}
+    row[scoring_rules.score_columns[0]] = "99999999999999999999"
+    set_table_rows(scores, pairs, "Chave 0", "Sao Bento", [row], scoring_rules)
+    assert np.sum(scores) == 2 * (len(scoring_rules.score_columns) - 1)
@@ -0,0 +1,37 @@
+"""
+Players that are tied in all tie break keys across the cut, see
+_find_ties_in_round.
+"""
+
+from app_state import get_round
+
+
+def test_choose_tied_players_for_open_spots(client):
+    # nobody has points yet, all 5 players of cat. B are tied
+    round_id = {"round": 1, "index": "cat. B"}
+    tiebreaker_id = {"type": "round_tie_breaker", **round_id}
+    client.fire({"type": "advance-dropdown", **round_id}, "value", 4)
+    tied_players = client.get(tiebreaker_id, "options")
+    assert len(tied_players) == 5
+    assert client.get({"type": "round-open-spots", **round_id}, "data") == 4
+
+    # too few chosen players do not start a round
+    button_id = {"type": "add-round-button", **round_id}
+    client.fire(tiebreaker_id, "value", tied_players[:3])
+    client.fire(button_id, "n_clicks", 1)
+    assert not client.find("chave-table", index="cat. B", round=2)
+
+    client.fire(tiebreaker_id, "value", tied_players[1:])
+    client.fire(button_id, "n_clicks", 2)
+    round_2 = get_round(client.get("session-id", "data"), "cat. B", 2)
+    assert sorted(round_2["players"]) == sorted(tied_players[1:])
+
+
+def test_no_tie(client):
+    # the 3 players of cat. A all advance
+    round_id = {"round": 1, "index": "cat. A"}
+    client.fire({"type": "advance-dropdown", **round_id}, "value", 4)
+    assert client.get({"type": "round_tie_breaker", **round_id}, "options") == [
+        "No tiebreaker needed"
+    ]
+    assert client.get({"type": "round-open-spots", **round_id}, "data") == 0